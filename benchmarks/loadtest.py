@@ -0,0 +1,323 @@
+"""
+Measure end-to-end issuance and redemption latency and throughput under
+concurrency against a stand-in token server on the loopback interface.
+
+The server follows the same flow as ``Server`` in ``spike.py`` but speaks
+JSON over HTTP and keeps every signing key it has used so passes for tokens
+issued before a key rotation can still be redeemed.
+
+Usage: python benchmarks/loadtest.py [--concurrency 1,2,4,8] [--batch-size 10]
+           [--requests 50] [--rotate-every 100]
+
+For each concurrency level, each client performs ``--requests`` rounds of
+issuing a batch of tokens and redeeming all of them.  The output is CSV with
+one row per concurrency level and operation.
+"""
+
+from __future__ import (
+    print_function,
+)
+
+from argparse import (
+    ArgumentParser,
+)
+from hashlib import (
+    sha256,
+)
+from http.client import (
+    HTTPConnection,
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from json import (
+    dumps,
+    loads,
+)
+from threading import (
+    Lock,
+    Thread,
+)
+from time import (
+    monotonic,
+)
+
+import attr
+
+from challenge_bypass_ristretto import (
+    Arena,
+    BatchDLEQProof,
+    BlindedToken,
+    PublicKey,
+    RandomToken,
+    SignedToken,
+    TokenPreimage,
+    VerificationSignature,
+    random_signing_key,
+)
+from challenge_bypass_ristretto.spent import (
+    SpentTokens,
+)
+from challenge_bypass_ristretto.stats import (
+    Histogram,
+    exponential_bounds,
+)
+
+
+def _encode(native):
+    return native.encode_base64().decode("ascii")
+
+
+def _decode_all(cls, texts):
+    return list(cls.decode_base64(text.encode("ascii")) for text in texts)
+
+
+@attr.s
+class TokenServer(object):
+    """
+    The issuance and redemption state of the stand-in server.
+
+    :ivar int rotate_every: The number of issuance requests after which to
+        switch to a new signing key, or ``None`` to never rotate.
+    """
+    rotate_every = attr.ib(default=None)
+
+    _lock = attr.ib(init=False, default=attr.Factory(Lock))
+    _keys = attr.ib(init=False, default=attr.Factory(dict))
+    _current = attr.ib(init=False, default=None)
+    _issued = attr.ib(init=False, default=0)
+    _spent = attr.ib(init=False, default=attr.Factory(SpentTokens))
+
+    def __attrs_post_init__(self):
+        self._rotate()
+
+    def _rotate(self):
+        signing_key = random_signing_key()
+        public_key = _encode(PublicKey.from_signing_key(signing_key))
+        key_id = sha256(public_key.encode("ascii")).hexdigest()[:16]
+        self._keys[key_id] = signing_key
+        self._spent.open(key_id)
+        self._current = key_id
+
+    def issue(self, request):
+        with self._lock:
+            self._issued += 1
+            if self.rotate_every and self._issued % self.rotate_every == 0:
+                self._rotate()
+            key_id = self._current
+            signing_key = self._keys[key_id]
+        with Arena():
+            blinded_tokens = _decode_all(BlindedToken, request["blinded_tokens"])
+            signed_tokens = list(map(signing_key.sign, blinded_tokens))
+            proof = BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens)
+            return {
+                "key_id": key_id,
+                "public_key": _encode(PublicKey.from_signing_key(signing_key)),
+                "signed_tokens": list(map(_encode, signed_tokens)),
+                "proof": _encode(proof),
+            }
+
+    def redeem(self, request):
+        signing_key = self._keys.get(request["key_id"])
+        if signing_key is None:
+            return {"error": "unknown key"}
+        message = request["message"].encode("utf-8")
+        with Arena():
+            passes = list(
+                (
+                    TokenPreimage.decode_base64(p.encode("ascii")),
+                    VerificationSignature.decode_base64(s.encode("ascii")),
+                )
+                for (p, s)
+                in request["passes"]
+            )
+            invalid = list(
+                signing_key.rederive_unblinded_token(
+                    token_preimage,
+                ).derive_verification_key_sha512().invalid_sha512(signature, message)
+                for (token_preimage, signature)
+                in passes
+            )
+            if any(self._spent.spend(
+                request["key_id"],
+                list(
+                    token_preimage
+                    for (is_invalid, (token_preimage, _))
+                    in zip(invalid, passes)
+                    if not is_invalid
+                ),
+            )):
+                return {"error": "double spend"}
+        return {"invalid": invalid}
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately.  Don't let Nagle's
+        # algorithm hold the body back waiting for a delayed ACK.
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            routes = {"/issue": server.issue, "/redeem": server.redeem}
+            request = loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path in routes:
+                response = routes[self.path](request)
+                status = 400 if "error" in response else 200
+            else:
+                response, status = {"error": "not found"}, 404
+            body = dumps(response).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *a):
+            pass
+
+    return Handler
+
+
+@attr.s
+class Client(object):
+    """
+    A client which issues and redeems tokens over one HTTP connection.
+    """
+    port = attr.ib()
+    batch_size = attr.ib()
+    issue_latency = attr.ib()
+    redeem_latency = attr.ib()
+
+    def _post(self, connection, path, request):
+        body = dumps(request).encode("utf-8")
+        connection.request("POST", path, body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        result = loads(response.read())
+        if response.status != 200:
+            raise Exception("{} failed: {}".format(path, result))
+        return result
+
+    def run(self, rounds, message):
+        connection = HTTPConnection("127.0.0.1", self.port)
+        try:
+            for _ in range(rounds):
+                with Arena():
+                    self._round(connection, message)
+        finally:
+            connection.close()
+
+    def _round(self, connection, message):
+        tokens, blinded_tokens = RandomToken.create_and_blind_many(self.batch_size)
+        before = monotonic()
+        issued = self._post(connection, "/issue", {
+            "blinded_tokens": list(map(_encode, blinded_tokens)),
+        })
+        self.issue_latency.record(monotonic() - before)
+
+        signed_tokens = _decode_all(SignedToken, issued["signed_tokens"])
+        unblinded_tokens = BatchDLEQProof.decode_base64(
+            issued["proof"].encode("ascii"),
+        ).invalid_or_unblind(
+            tokens,
+            blinded_tokens,
+            signed_tokens,
+            PublicKey.decode_base64(issued["public_key"].encode("ascii")),
+        )
+        passes = list(
+            [
+                _encode(t.preimage()),
+                _encode(t.derive_verification_key_sha512().sign_sha512(message)),
+            ]
+            for t
+            in unblinded_tokens
+        )
+
+        before = monotonic()
+        redeemed = self._post(connection, "/redeem", {
+            "key_id": issued["key_id"],
+            "message": message.decode("utf-8"),
+            "passes": passes,
+        })
+        self.redeem_latency.record(monotonic() - before)
+        if any(redeemed["invalid"]):
+            raise Exception("server rejected valid passes")
+
+
+def _latency_histogram():
+    # 100 microseconds up to about 30 seconds.
+    return Histogram(exponential_bounds(0.0001, 1.5, 32))
+
+
+def measure(port, concurrency, rounds, batch_size):
+    """
+    Run ``concurrency`` clients against the server at ``port`` at once.
+
+    :return: A two-tuple of the elapsed seconds and a ``dict`` mapping
+        operation names to latency ``HistogramSnapshot``.
+    """
+    issue_latency = _latency_histogram()
+    redeem_latency = _latency_histogram()
+    clients = list(
+        Client(port, batch_size, issue_latency, redeem_latency)
+        for _ in range(concurrency)
+    )
+    threads = list(
+        Thread(target=client.run, args=(rounds, b"loadtest"))
+        for client
+        in clients
+    )
+    before = monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = monotonic() - before
+    return elapsed, {
+        "issue": issue_latency.snapshot(),
+        "redeem": redeem_latency.snapshot(),
+    }
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--rotate-every", type=int, default=None)
+    options = parser.parse_args(argv)
+
+    token_server = TokenServer(options.rotate_every)
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(token_server))
+    http_server.daemon_threads = True
+    serving = Thread(target=http_server.serve_forever)
+    serving.daemon = True
+    serving.start()
+    port = http_server.server_address[1]
+
+    print("concurrency,operation,requests,requests_per_second,tokens_per_second,p50_ms,p99_ms")
+    try:
+        for concurrency in (int(c) for c in options.concurrency.split(",")):
+            elapsed, latencies = measure(
+                port,
+                concurrency,
+                options.requests,
+                options.batch_size,
+            )
+            for (operation, latency) in sorted(latencies.items()):
+                print("{},{},{},{:0.1f},{:0.1f},{:0.2f},{:0.2f}".format(
+                    concurrency,
+                    operation,
+                    latency.count,
+                    latency.count / elapsed,
+                    latency.count * options.batch_size / elapsed,
+                    latency.quantile(0.5) * 1000,
+                    latency.quantile(0.99) * 1000,
+                ))
+    finally:
+        http_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare checking many passes for one message with
+``VerificationKey.invalid_sha512`` in a loop against
+``VerificationKey.invalid_sha512_many``.
+
+Usage: python benchmarks/mac.py [count] [corpus]
+
+The passes come from the first key set of a corpus: by default one of
+``count`` tokens generated from the fixed seed, or else the corpus file at
+``corpus``, as written by ``python -m challenge_bypass_ristretto.corpus``.
+"""
+
+from __future__ import (
+    print_function,
+)
+
+from contextlib import (
+    contextmanager,
+)
+from sys import (
+    argv,
+)
+from time import (
+    time,
+)
+
+from challenge_bypass_ristretto import (
+    VerificationKey,
+)
+from challenge_bypass_ristretto.corpus import (
+    generate,
+    load,
+)
+
+
+@contextmanager
+def timing(label, count):
+    before = time()
+    yield
+    after = time()
+    print("{},{},{:0.2f}".format(label, count, (after - before) * 1000))
+
+
+def main(count=b"1000", path=None):
+    if path is None:
+        corpus = generate(
+            key_count=1,
+            token_count=int(count),
+            message=b"allocate_buckets ABCDEFGH",
+        )
+    else:
+        corpus = load(path)
+    key_set = corpus.key_sets[0]
+    message = corpus.message
+    keys = list(
+        unblinded_token.derive_verification_key_sha512()
+        for unblinded_token
+        in key_set.unblinded_tokens
+    )
+    signatures = list(signature for (_, signature) in key_set.passes)
+    count = len(keys)
+
+    print("label,count,milliseconds")
+    with timing("invalid_sha512-loop", count):
+        looped = list(
+            key.invalid_sha512(signature, message)
+            for (key, signature)
+            in zip(keys, signatures)
+        )
+    with timing("invalid_sha512_many", count):
+        bitmap = VerificationKey.invalid_sha512_many(keys, signatures, message)
+    assert not any(looped) and bitmap == 0
+
+
+if __name__ == "__main__":
+    main(*argv[1:])
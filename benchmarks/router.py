@@ -0,0 +1,199 @@
+"""
+Measure how redemption throughput scales when passes are routed by
+consistent hashing to local worker processes, each of which verifies its
+passes and checks them against its own slice of the spent-token state.
+
+Usage: python benchmarks/router.py [--workers 1,2,4] [--passes 4000]
+           [--batch-size 100]
+
+The output is CSV with one row per number of workers.  Each batch is split
+by ``Router``, sent to every worker with something to do at once, and the
+answers gathered back into batch order.  Every pass is redeemed exactly
+once, so a correct run reports no invalid passes or double spends.
+"""
+
+from __future__ import (
+    print_function,
+)
+
+from argparse import (
+    ArgumentParser,
+)
+from base64 import (
+    b64decode,
+)
+from hashlib import (
+    blake2b,
+)
+from multiprocessing import (
+    Pipe,
+    Process,
+)
+from time import (
+    monotonic,
+)
+
+from challenge_bypass_ristretto import (
+    Arena,
+    RandomToken,
+    SigningKey,
+    TokenPreimage,
+    VerificationKey,
+    VerificationSignature,
+    random_signing_key,
+)
+from challenge_bypass_ristretto.router import (
+    HashRing,
+    Router,
+)
+from challenge_bypass_ristretto.spent import (
+    DIGEST_SIZE,
+    SpentTokens,
+)
+
+MESSAGE = b"router benchmark"
+
+
+def _spend(spent, token_preimages):
+    """
+    Spend every one of ``token_preimages`` which has not been spent already.
+
+    ``SpentTokens.spend`` records nothing if anything in the batch was
+    already spent, so the batch is tried again without those until it goes
+    through.
+
+    :return list[bool]: For each token, whether it had already been spent.
+    """
+    double_spent = [False] * len(token_preimages)
+    remaining = list(range(len(token_preimages)))
+    while remaining:
+        result = spent.spend("k", list(token_preimages[n] for n in remaining))
+        if not any(result):
+            break
+        for (n, already) in zip(remaining, result):
+            double_spent[n] = double_spent[n] or already
+        remaining = list(n for (n, already) in zip(remaining, result) if not already)
+    return double_spent
+
+
+def serve(connection, encoded_signing_key):
+    """
+    Verify and spend the batches of encoded passes which arrive on
+    ``connection`` until ``None`` arrives.
+    """
+    signing_key = SigningKey.decode_base64(encoded_signing_key)
+    spent = SpentTokens()
+    spent.open("k")
+    while True:
+        passes = connection.recv()
+        if passes is None:
+            return
+        with Arena():
+            token_preimages = list(TokenPreimage.decode_base64(p) for (p, _) in passes)
+            bitmap = VerificationKey.invalid_sha512_many(
+                list(
+                    signing_key.rederive_unblinded_token(
+                        token_preimage,
+                    ).derive_verification_key_sha512()
+                    for token_preimage
+                    in token_preimages
+                ),
+                list(VerificationSignature.decode_base64(s) for (_, s) in passes),
+                MESSAGE,
+            )
+            invalid = list(bool(bitmap >> n & 1) for n in range(len(passes)))
+            # Only passes with a valid signature are spent.
+            valid = list(n for n in range(len(passes)) if not invalid[n])
+            double_spent = _spend(spent, list(token_preimages[n] for n in valid))
+            for (n, already) in zip(valid, double_spent):
+                invalid[n] = already
+        connection.send(invalid)
+
+
+def make_passes(signing_key, count):
+    tokens, blinded_tokens = RandomToken.create_and_blind_many(count)
+    return list(
+        (
+            unblinded_token.preimage().encode_base64(),
+            unblinded_token.derive_verification_key_sha512().sign_sha512(
+                MESSAGE,
+            ).encode_base64(),
+        )
+        for unblinded_token
+        in RandomToken.unblind_many(tokens, list(map(signing_key.sign, blinded_tokens)))
+    )
+
+
+def _preimage_digest(encoded_pass):
+    # The same digest as ``preimage_digest``, without decoding the preimage.
+    # The encoding came from ``encode_base64`` so it is already canonical.
+    return blake2b(b64decode(encoded_pass[0]), digest_size=DIGEST_SIZE).digest()
+
+
+def measure(signing_key, worker_count, passes, batch_size):
+    """
+    Redeem ``passes`` through ``worker_count`` worker processes.
+
+    :return: A two-tuple of the elapsed seconds and the number of passes
+        reported invalid.
+    """
+    encoded_signing_key = signing_key.encode_base64()
+    names = list("worker-{}".format(n) for n in range(worker_count))
+    connections = {}
+    processes = []
+    for name in names:
+        ours, theirs = Pipe()
+        process = Process(target=serve, args=(theirs, encoded_signing_key))
+        process.start()
+        connections[name] = ours
+        processes.append(process)
+
+    router = Router(HashRing(names), digest=_preimage_digest)
+    invalid = 0
+    before = monotonic()
+    try:
+        for start in range(0, len(passes), batch_size):
+            batch = passes[start:start + batch_size]
+            batches = router.partition(batch)
+            for (name, (_, owned)) in batches.items():
+                connections[name].send(owned)
+            results = {name: connections[name].recv() for name in batches}
+            invalid += sum(router.gather(len(batch), batches, results))
+        elapsed = monotonic() - before
+    finally:
+        for name in names:
+            connections[name].send(None)
+        for process in processes:
+            process.join()
+    return elapsed, invalid
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--passes", type=int, default=4000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    options = parser.parse_args(argv)
+
+    signing_key = random_signing_key()
+    passes = make_passes(signing_key, options.passes)
+
+    print("workers,passes,seconds,passes_per_second,speedup,invalid")
+    baseline = None
+    for worker_count in (int(w) for w in options.workers.split(",")):
+        elapsed, invalid = measure(signing_key, worker_count, passes, options.batch_size)
+        rate = len(passes) / elapsed
+        if baseline is None:
+            baseline = rate
+        print("{},{},{:0.3f},{:0.1f},{:0.2f},{}".format(
+            worker_count,
+            len(passes),
+            elapsed,
+            rate,
+            rate / baseline,
+            invalid,
+        ))
+
+
+if __name__ == "__main__":
+    main()
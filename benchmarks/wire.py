@@ -0,0 +1,111 @@
+"""
+Compare the binary container format in ``challenge_bypass_ristretto.wire``
+with JSON lists of base64 strings for size and speed.
+
+Usage: python benchmarks/wire.py [count] [corpus]
+
+The tokens and proof come from the first key set of a corpus: by default one
+of ``count`` tokens generated from the fixed seed, or else the corpus file at
+``corpus``, as written by ``python -m challenge_bypass_ristretto.corpus``.
+"""
+
+from __future__ import (
+    print_function,
+)
+
+from contextlib import (
+    contextmanager,
+)
+from io import (
+    BytesIO,
+)
+from json import (
+    dumps,
+    loads,
+)
+from sys import (
+    argv,
+)
+from time import (
+    time,
+)
+
+from challenge_bypass_ristretto import (
+    BlindedToken,
+    SignedToken,
+    BatchDLEQProof,
+)
+from challenge_bypass_ristretto.corpus import (
+    generate,
+    load,
+)
+from challenge_bypass_ristretto.wire import (
+    write_issue_request,
+    read_issue_request,
+    write_issue_response,
+    read_issue_response,
+)
+
+
+@contextmanager
+def timing(label, count, size):
+    before = time()
+    yield
+    after = time()
+    print("{},{},{:0.2f},{}".format(label, count, (after - before) * 1000, size()))
+
+
+def json_issue_request(blinded_tokens):
+    return dumps(list(t.encode_base64().decode("ascii") for t in blinded_tokens)).encode("ascii")
+
+
+def json_issue_response(signed_tokens, proof):
+    return dumps({
+        "signed_tokens": list(t.encode_base64().decode("ascii") for t in signed_tokens),
+        "proof": proof.encode_base64().decode("ascii"),
+    }).encode("ascii")
+
+
+def main(count=b"1000", path=None):
+    if path is None:
+        corpus = generate(key_count=1, token_count=int(count))
+    else:
+        corpus = load(path)
+    key_set = corpus.key_sets[0]
+    blinded_tokens = key_set.blinded_tokens
+    signed_tokens = key_set.signed_tokens
+    proof = key_set.proof
+    count = len(blinded_tokens)
+
+    result = {}
+    print("label,count,milliseconds,bytes")
+
+    with timing("json-request-encode", count, lambda: len(result["json"])):
+        result["json"] = json_issue_request(blinded_tokens)
+    with timing("json-request-decode", count, lambda: len(result["json"])):
+        list(map(BlindedToken.decode_base64, (t.encode("ascii") for t in loads(result["json"]))))
+
+    with timing("binary-request-encode", count, lambda: len(result["binary"])):
+        stream = BytesIO()
+        write_issue_request(stream, blinded_tokens)
+        result["binary"] = stream.getvalue()
+    with timing("binary-request-decode", count, lambda: len(result["binary"])):
+        read_issue_request(BytesIO(result["binary"]))
+
+    with timing("json-response-encode", count, lambda: len(result["json"])):
+        result["json"] = json_issue_response(signed_tokens, proof)
+    with timing("json-response-decode", count, lambda: len(result["json"])):
+        response = loads(result["json"])
+        list(map(SignedToken.decode_base64, (t.encode("ascii") for t in response["signed_tokens"])))
+        BatchDLEQProof.decode_base64(response["proof"].encode("ascii"))
+
+    with timing("binary-response-encode", count, lambda: len(result["binary"])):
+        stream = BytesIO()
+        write_issue_response(stream, signed_tokens, proof)
+        result["binary"] = stream.getvalue()
+    with timing("binary-response-decode", count, lambda: len(result["binary"])):
+        read_issue_response(BytesIO(result["binary"]))
+
+
+if __name__ == "__main__":
+    main(*argv[1:])
@@ -1,3 +1,22 @@
+from base64 import (
+    b64encode,
+)
+from contextlib import (
+    contextmanager,
+)
+from hashlib import (
+    sha512,
+)
+from itertools import (
+    count,
+)
+from struct import (
+    pack,
+)
+from threading import (
+    local,
+)
+
 import attr
 
 from ._native import ffi, lib
@@ -25,14 +44,95 @@ def _raw_attr():
     return attr.ib(validator=not_null)
 
 
+def _last_error(f):
+    """
+    Take the message describing why a native call failed.
+
+    The native library keeps the last error in thread-local storage so this
+    must be called on the same thread as the failed call, and before that
+    thread makes any other native call.  That way concurrent calls on other
+    threads can neither overwrite nor steal the message.
+
+    :param f: The native function which failed, used to describe the failure
+        if the library did not record a message for it.
+
+    :return bytes: The message.
+    """
+    message = lib.last_error_message()
+    if message == ffi.NULL:
+        return "{} failed".format(getattr(f, "__name__", "native call")).encode("ascii")
+    return to_string(message)
+
+
+def _discard_last_error():
+    """
+    Drop any message the native library recorded for the calling thread.
+
+    A check which finds a proof or signature invalid returns normally but may
+    still record why.  That message must be taken then, or the next failure
+    on the thread without a message of its own would report it instead.
+    """
+    lib.last_error_message()
+
+
 def _call_with_raising(exc_val, exc_type, f, *a):
     result = f(*a)
     if result == exc_val:
-        raise exc_type(to_string(lib.last_error_message()))
+        raise exc_type(_last_error(f))
     return result
 
 
-def random_signing_key():
+# The order of the Ristretto group.  Encoded scalars are only accepted by the
+# decoders if they are already reduced modulo this.
+_GROUP_ORDER = 2 ** 252 + 27742317777372353535851937790883648493
+
+# Scalars are drawn from twice as many bytes as they are encoded in so that
+# reducing them modulo the group order leaves a negligible bias.
+_WIDE_SCALAR_LENGTH = 64
+
+_TOKEN_PREIMAGE_LENGTH = 64
+
+
+def _scalar_from_wide_bytes(wide):
+    return (int.from_bytes(wide, "little") % _GROUP_ORDER).to_bytes(32, "little")
+
+
+def seeded_random_bytes(seed):
+    """
+    Make a deterministic source of random bytes suitable for passing as the
+    ``random_bytes`` argument of ``random_signing_key`` and
+    ``Token.create_many``.
+
+    This is for reproducible tests and benchmarks only.  Anyone who knows the
+    seed can recompute every secret derived from it.
+
+    :param bytes seed: The seed from which to derive all of the bytes.
+
+    :return: A function which takes a number of bytes and returns that many
+        bytes from a SHA-512 counter-mode stream keyed by ``seed``.
+    """
+    counter = count()
+    def random_bytes(length):
+        blocks = (length + 63) // 64
+        return b"".join(
+            sha512(seed + pack(">Q", next(counter))).digest()
+            for _ in range(blocks)
+        )[:length]
+    return random_bytes
+
+
+def random_signing_key(random_bytes=None):
+    """
+    Create a new random ``SigningKey``.
+
+    :param random_bytes: If not ``None``, a function like ``os.urandom`` from
+        which to draw the key instead of the native library's random number
+        generator.
+    """
+    if random_bytes is not None:
+        return SigningKey.decode_base64(
+            b64encode(_scalar_from_wide_bytes(random_bytes(_WIDE_SCALAR_LENGTH))),
+        )
     return SigningKey(
         _call_with_raising(
             ffi.NULL,
@@ -42,29 +142,160 @@ def random_signing_key():
     )
 
 
+# Per-thread stack of the active ``Arena`` instances.
+_arenas = local()
+
+
+def _arena_stack():
+    try:
+        return _arenas.stack
+    except AttributeError:
+        _arenas.stack = []
+        return _arenas.stack
+
+
+def current_arena():
+    """
+    :return: The innermost ``Arena`` active on the calling thread or ``None``
+        if there is none.
+    """
+    stack = _arena_stack()
+    if stack:
+        return stack[-1]
+    return None
+
+
+@contextmanager
+def outside_arena():
+    """
+    Suspend every ``Arena`` active on the calling thread for the duration of
+    a ``with`` block.  Wrappers created inside the block are not tracked and
+    outlive the suspended arenas, which suits objects kept in long-lived
+    caches and pools.
+    """
+    stack = _arena_stack()
+    _arenas.stack = []
+    try:
+        yield
+    finally:
+        _arenas.stack = stack
+
+
+@attr.s
+class Arena(object):
+    """
+    Collect the native objects wrapped on the calling thread while the arena
+    is active and destroy all of them together when it exits.
+
+    For example::
+
+        with Arena() as arena:
+            blinded_tokens = list(map(BlindedToken.decode_base64, marshaled))
+            ...
+            arena.keep(something_to_return)
+
+    Every wrapper created inside the ``with`` block, other than those passed
+    to ``keep``, is unusable after it.  Wrappers created on other threads are
+    not affected.
+    """
+    _objects = attr.ib(init=False, default=attr.Factory(dict))
+
+    def __enter__(self):
+        _arena_stack().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        stack = _arena_stack()
+        if not stack or stack[-1] is not self:
+            raise ValueError("Arena exited out of order")
+        stack.pop()
+        self.release()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def _track(self, native):
+        self._objects[id(native)] = native
+
+    def keep(self, native):
+        """
+        Stop tracking a wrapper so that it outlives the arena.
+
+        :return: ``native``
+        """
+        self._objects.pop(id(native), None)
+        return native
+
+    def release(self):
+        """
+        Destroy every native object tracked so far, except those already
+        destroyed some other way.
+        """
+        objects = self._objects
+        self._objects = {}
+        for native in objects.values():
+            if native._raw is not None:
+                native.destroy()
+
+
+# The allocation tracker installed by ``challenge_bypass_ristretto.diagnostics``
+# or ``None`` if diagnostics are disabled.
+_tracker = None
+
+
+def _set_tracker(tracker):
+    global _tracker
+    _tracker = tracker
+
+
 @attr.s
-class _Serializable(object):
+class _Native(object):
     _raw = _raw_attr()
 
+    def __attrs_post_init__(self):
+        if _tracker is not None:
+            _tracker.allocated(self)
+        stack = _arena_stack()
+        if stack:
+            stack[-1]._track(self)
+
+    def destroy(self):
+        """
+        Release the native object.  The wrapper cannot be used after this.
+        """
+        if _tracker is not None:
+            _tracker.destroyed(self)
+        self._destructor(self._raw)
+        self._raw = None
+
+
+@attr.s
+class _Serializable(_Native):
     def encode_base64(self):
         # We don't use _call_with_raising for encoding and decoding because
-        # they don't set last error message (I guess).
+        # they don't reliably set the last error message.  Still take
+        # whatever they did set so it cannot be mistaken for the error of a
+        # later call on this thread.
         encoded = self._encoder(self._raw)
         if encoded == ffi.NULL:
-            raise TokenException("encoding token to base64 bytes failed")
+            raise TokenException(
+                "encoding token to base64 bytes failed",
+                _last_error(self._encoder),
+            )
         return to_string(encoded)
 
     @classmethod
     def decode_base64(cls, text):
         decoded = cls._decoder(text, len(text))
         if decoded == ffi.NULL:
-            raise DecodeException()
+            raise DecodeException(_last_error(cls._decoder))
         return cls(decoded)
 
 
 class SigningKey(_Serializable):
     _encoder = lib.signing_key_encode_base64
     _decoder = lib.signing_key_decode_base64
+    _destructor = lib.signing_key_destroy
 
     def sign(self, blinded_token):
         assert(isinstance(blinded_token, BlindedToken))
@@ -93,16 +324,19 @@ class SigningKey(_Serializable):
 class SignedToken(_Serializable):
     _encoder = lib.signed_token_encode_base64
     _decoder = lib.signed_token_decode_base64
+    _destructor = lib.signed_token_destroy
 
 
 class BlindedToken(_Serializable):
     _encoder = lib.blinded_token_encode_base64
     _decoder = lib.blinded_token_decode_base64
+    _destructor = lib.blinded_token_destroy
 
 
 class UnblindedToken(_Serializable):
     _encoder = lib.unblinded_token_encode_base64
     _decoder = lib.unblinded_token_decode_base64
+    _destructor = lib.unblinded_token_destroy
 
     def preimage(self):
         return TokenPreimage(
@@ -128,11 +362,11 @@ class UnblindedToken(_Serializable):
 class TokenPreimage(_Serializable):
     _encoder = lib.token_preimage_encode_base64
     _decoder = lib.token_preimage_decode_base64
+    _destructor = lib.token_preimage_destroy
 
 
-@attr.s
-class VerificationKey(object):
-    _raw = _raw_attr()
+class VerificationKey(_Native):
+    _destructor = lib.verification_key_destroy
 
     def sign_sha512(self, message):
         return VerificationSignature(
@@ -157,17 +391,54 @@ class VerificationKey(object):
             len(message),
         )
         assert result in (0, 1)
+        if result:
+            _discard_last_error()
         return bool(result)
 
+    @classmethod
+    def invalid_sha512_many(cls, keys, signatures, message):
+        """
+        Check many signatures of one message, each against its own key.
+
+        HMAC keys its hash before the message is absorbed so there is no
+        digest state which can be shared between keys.  What is shared is
+        everything on the Python side: the message is measured and the native
+        function looked up once for the whole batch.
+
+        :param list[VerificationKey] keys: The keys.
+        :param list[VerificationSignature] signatures: The signatures, one
+            for each key.
+        :param bytes message: The message all of the signatures are for.
+
+        :return int: A bitmap with bit ``n`` set if ``signatures[n]`` is not a
+            valid signature of ``message`` by ``keys[n]``.  It is ``0`` if all
+            of the signatures are valid.
+        """
+        if len(keys) != len(signatures):
+            raise ValueError("Verification requires same number of keys and signatures")
+        invalid_sha512 = lib.verification_key_invalid_sha512
+        message_length = len(message)
+        bitmap = 0
+        for (n, (key, signature)) in enumerate(zip(keys, signatures)):
+            result = invalid_sha512(key._raw, signature._raw, message, message_length)
+            if result == -1:
+                raise Exception(_last_error(invalid_sha512))
+            if result:
+                _discard_last_error()
+                bitmap |= 1 << n
+        return bitmap
+
 
 class VerificationSignature(_Serializable):
     _encoder = lib.verification_signature_encode_base64
     _decoder = lib.verification_signature_decode_base64
+    _destructor = lib.verification_signature_destroy
 
 
 class Token(_Serializable):
     _encoder = lib.token_encode_base64
     _decoder = lib.token_decode_base64
+    _destructor = lib.token_destroy
 
     @classmethod
     def create(cls):
@@ -179,6 +450,111 @@ class Token(_Serializable):
             ),
         )
 
+    @classmethod
+    def create_many(cls, count, random_bytes=None):
+        """
+        Create many new random tokens.
+
+        :param int count: The number of tokens to create.
+
+        :param random_bytes: If ``None``, each token is created by the native
+            library's random number generator.  Otherwise, a function like
+            ``os.urandom`` from which the randomness for all of the tokens is
+            drawn in a single call (see ``seeded_random_bytes``).
+
+        :return: A ``list`` of ``count`` new ``Token`` instances.
+        """
+        if random_bytes is None:
+            token_random = lib.token_random
+            return list(
+                cls(_call_with_raising(ffi.NULL, TokenException, token_random))
+                for _ in range(count)
+            )
+
+        width = _TOKEN_PREIMAGE_LENGTH + _WIDE_SCALAR_LENGTH
+        entropy = random_bytes(count * width)
+        if len(entropy) != count * width:
+            raise ValueError(
+                "random_bytes returned {} bytes, expected {}".format(
+                    len(entropy),
+                    count * width,
+                ),
+            )
+        return list(
+            cls.decode_base64(b64encode(
+                entropy[offset:offset + _TOKEN_PREIMAGE_LENGTH] +
+                _scalar_from_wide_bytes(entropy[offset + _TOKEN_PREIMAGE_LENGTH:offset + width]),
+            ))
+            for offset
+            in range(0, len(entropy), width)
+        )
+
+    @classmethod
+    def blind_many(cls, tokens):
+        """
+        Blind many tokens.
+
+        :param list[Token] tokens: The tokens to blind.
+
+        :return: A ``list`` of the ``BlindedToken`` for each of ``tokens``, in
+            the same order.
+        """
+        token_blind = lib.token_blind
+        return list(
+            BlindedToken(
+                _call_with_raising(ffi.NULL, TokenException, token_blind, token._raw),
+            )
+            for token
+            in tokens
+        )
+
+    @classmethod
+    def unblind_many(cls, tokens, signed_tokens):
+        """
+        Unblind many signed tokens without verifying a proof.
+
+        The caller is responsible for having checked the signed tokens with
+        ``BatchDLEQProof.invalid`` first.  Since this does not need the
+        proof, a large batch can be unblinded in chunks some time after it
+        was verified.
+
+        :param list[Token] tokens: The tokens from which the signed tokens
+            were made.
+        :param list[SignedToken] signed_tokens: The corresponding signed
+            tokens.
+
+        :return: A ``list`` of the ``UnblindedToken`` for each pair, in order.
+        """
+        if len(tokens) != len(signed_tokens):
+            raise ValueError("Unblinding requires same number of tokens and signed tokens")
+        token_unblind = lib.token_unblind
+        return list(
+            UnblindedToken(
+                _call_with_raising(
+                    ffi.NULL,
+                    TokenException,
+                    token_unblind,
+                    token._raw,
+                    signed_token._raw,
+                ),
+            )
+            for (token, signed_token)
+            in zip(tokens, signed_tokens)
+        )
+
+    @classmethod
+    def create_and_blind_many(cls, count, random_bytes=None):
+        """
+        Create and blind many new random tokens.
+
+        :see: ``Token.create_many``
+
+        :return: A two-tuple of a ``list`` of ``count`` new ``Token`` instances
+            and a ``list`` of the corresponding ``BlindedToken`` instances.
+        """
+        tokens = cls.create_many(count, random_bytes)
+        return tokens, cls.blind_many(tokens)
+
     def blind(self):
         return BlindedToken(
             _call_with_raising(
@@ -189,6 +565,17 @@ class Token(_Serializable):
             ),
         )
 
+    def unblind(self, signed_token):
+        return UnblindedToken(
+            _call_with_raising(
+                ffi.NULL,
+                TokenException,
+                lib.token_unblind,
+                self._raw,
+                signed_token._raw,
+            ),
+        )
+
 # Maintain backwards compatibility with the old, confusing name.  It is not a
 # "Random Token" it is a random "Token".
 RandomToken = Token
@@ -197,6 +584,7 @@ RandomToken = Token
 class PublicKey(_Serializable):
     _encoder = lib.public_key_encode_base64
     _decoder = lib.public_key_decode_base64
+    _destructor = lib.public_key_destroy
 
     @classmethod
     def from_signing_key(cls, signing_key):
@@ -213,6 +601,7 @@ class PublicKey(_Serializable):
 class BatchDLEQProof(_Serializable):
     _encoder = lib.batch_dleq_proof_encode_base64
     _decoder = lib.batch_dleq_proof_decode_base64
+    _destructor = lib.batch_dleq_proof_destroy
 
     @classmethod
     def create(cls, signing_key, blinded_tokens, signed_tokens):
@@ -226,9 +615,31 @@ class BatchDLEQProof(_Serializable):
             signing_key._raw,
         ))
 
-    def destroy(self):
-        lib.batch_dleq_proof_destroy(self._raw)
-        self._raw = None
+    def invalid(self, blinded_tokens, signed_tokens, public_key):
+        """
+        Check the proof without unblinding anything.
+
+        :return bool: ``True`` if the proof is not valid for the given tokens
+            and public key, ``False`` if it is.
+        """
+        if len(blinded_tokens) != len(signed_tokens):
+            raise ValueError(
+                "Validation requires same number of blinded tokens and signed tokens."
+            )
+        result = _call_with_raising(
+            -1,
+            Exception,
+            lib.batch_dleq_proof_invalid,
+            self._raw,
+            list(t._raw for t in blinded_tokens),
+            list(t._raw for t in signed_tokens),
+            len(blinded_tokens),
+            public_key._raw,
+        )
+        assert result in (0, 1)
+        if result:
+            _discard_last_error()
+        return bool(result)
 
     def invalid_or_unblind(self, tokens, blinded_tokens, signed_tokens, public_key):
         if len(tokens) != len(blinded_tokens) or len(tokens) != len(signed_tokens):
@@ -246,9 +657,84 @@ class BatchDLEQProof(_Serializable):
             public_key._raw,
         )
         if invalid_or_unblind != 0:
-            raise SecurityException("invalid batch proof ({})".format(invalid_or_unblind))
+            raise SecurityException(
+                "invalid batch proof ({})".format(invalid_or_unblind),
+                _last_error(lib.batch_dleq_proof_invalid_or_unblind),
+            )
         return list(
             UnblindedToken(unblinded_tokens_OUT[n])
             for n
             in range(len(tokens))
         )
+
+
+@attr.s
+class BatchDLEQProofBuilder(object):
+    """
+    Collect blinded and signed tokens as they are produced and create the
+    ``BatchDLEQProof`` for all of them at the end.
+
+    For example::
+
+        builder = BatchDLEQProofBuilder(signing_key)
+        for blinded_token in read_blinded_tokens():
+            send(builder.sign(blinded_token))
+        send(builder.finish())
+
+    The proof commits to every pair at once, so it can only be computed once
+    the last pair is known.  The builder lets signing go on while the rest of
+    the batch is still arriving.  The tokens added must not be destroyed
+    before ``finish`` is called; the builder holds references to them.
+
+    :ivar SigningKey signing_key: The key the tokens are signed with.
+    """
+    signing_key = attr.ib()
+
+    _blinded_tokens = attr.ib(init=False, default=attr.Factory(list))
+    _signed_tokens = attr.ib(init=False, default=attr.Factory(list))
+    _finished = attr.ib(init=False, default=False)
+
+    def __len__(self):
+        return len(self._blinded_tokens)
+
+    def add(self, blinded_token, signed_token):
+        """
+        Include a blinded token and its signature in the proof.
+        """
+        if self._finished:
+            raise ValueError("BatchDLEQProofBuilder already finished")
+        self._blinded_tokens.append(blinded_token)
+        self._signed_tokens.append(signed_token)
+
+    def sign(self, blinded_token):
+        """
+        Sign a blinded token and include it in the proof.
+
+        :return SignedToken: The signature.
+        """
+        signed_token = self.signing_key.sign(blinded_token)
+        self.add(blinded_token, signed_token)
+        return signed_token
+
+    def finish(self):
+        """
+        Create the proof for everything added so far.  Nothing can be added
+        afterwards.
+
+        :raise ValueError: If nothing was added.
+
+        :return BatchDLEQProof: The proof.
+        """
+        if self._finished:
+            raise ValueError("BatchDLEQProofBuilder already finished")
+        if not self._blinded_tokens:
+            raise ValueError("BatchDLEQProofBuilder requires at least one pair")
+        self._finished = True
+        proof = BatchDLEQProof(lib.batch_dleq_proof_new(
+            list(t._raw for t in self._blinded_tokens),
+            list(t._raw for t in self._signed_tokens),
+            len(self._blinded_tokens),
+            self.signing_key._raw,
+        ))
+        del self._blinded_tokens[:], self._signed_tokens[:]
+        return proof
@@ -0,0 +1,290 @@
+"""
+Caches which let services skip repeated native work.
+"""
+
+from collections import (
+    OrderedDict,
+)
+from hashlib import (
+    sha256,
+)
+from struct import (
+    pack,
+)
+from threading import (
+    Lock,
+)
+from time import (
+    monotonic,
+)
+
+import attr
+
+from . import (
+    Arena,
+    BlindedToken,
+    BatchDLEQProof,
+    PublicKey,
+    SigningKey,
+    outside_arena,
+)
+
+
+@attr.s
+class CacheStats(object):
+    """
+    Counters describing the effectiveness of a cache.
+
+    :ivar int size: The number of entries in the cache right now.
+    :ivar int hits: The number of lookups which found a live entry.
+    :ivar int misses: The number of lookups which did not.
+    :ivar int evictions: The number of entries dropped to make room for new
+        ones.
+    :ivar int expirations: The number of entries dropped because they
+        outlived the cache's time-to-live.
+    """
+    size = attr.ib(default=0)
+    hits = attr.ib(default=0)
+    misses = attr.ib(default=0)
+    evictions = attr.ib(default=0)
+    expirations = attr.ib(default=0)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return None
+        return self.hits / lookups
+
+
+_MISSING = object()
+
+
+@attr.s
+class LRUCache(object):
+    """
+    A thread-safe mapping which holds at most ``maxsize`` entries, dropping
+    the least recently used when it is full, and optionally drops entries
+    ``ttl`` seconds after they are added.
+
+    :ivar int maxsize: The most entries to hold.
+    :ivar ttl: The number of seconds an entry lives or ``None`` for no limit.
+    :ivar clock: A zero-argument function giving the current time in
+        seconds.
+    """
+    maxsize = attr.ib()
+    ttl = attr.ib(default=None)
+    clock = attr.ib(default=monotonic)
+
+    _entries = attr.ib(init=False, default=attr.Factory(OrderedDict))
+    _stats = attr.ib(init=False, default=attr.Factory(CacheStats))
+    _lock = attr.ib(init=False, default=attr.Factory(Lock))
+
+    def __attrs_post_init__(self):
+        if self.maxsize < 1:
+            raise ValueError("LRUCache requires a positive maxsize")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Look up an entry, counting a hit or a miss.
+
+        :return: The value for ``key`` or ``default`` if there is no live
+            entry for it.
+        """
+        with self._lock:
+            expires, value = self._entries.get(key, (None, _MISSING))
+            if value is not _MISSING and expires is not None and expires <= self.clock():
+                del self._entries[key]
+                self._stats.expirations += 1
+                value = _MISSING
+            if value is _MISSING:
+                self._stats.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Add or replace an entry, evicting the least recently used entry if
+        the cache is full.
+        """
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Drop the entry for ``key``, if there is one.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drop all entries.  The counters are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :return CacheStats: A snapshot of the cache's counters.
+        """
+        with self._lock:
+            return attr.evolve(self._stats, size=len(self._entries))
+
+
+def issuance_digest(key_id, marshaled_blinded_tokens):
+    """
+    Compute a key identifying an issuance request.
+
+    :param bytes key_id: An identifier for the key which signs the request,
+        for example its base64-encoded ``PublicKey``.
+    :param list[bytes] marshaled_blinded_tokens: The base64-encoded blinded
+        tokens of the request, in order.
+
+    :return bytes: A SHA-256 digest of the key identifier and the blinded
+        tokens.
+    """
+    h = sha256()
+    for item in [key_id] + list(marshaled_blinded_tokens):
+        h.update(pack(">Q", len(item)))
+        h.update(item)
+    return h.digest()
+
+
+def _issue(signing_key, marshaled_blinded_tokens):
+    with Arena():
+        blinded_tokens = list(
+            BlindedToken.decode_base64(marshaled_blinded_token)
+            for marshaled_blinded_token
+            in marshaled_blinded_tokens
+        )
+        signed_tokens = list(map(signing_key.sign, blinded_tokens))
+        proof = BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens)
+        return (
+            list(signed_token.encode_base64() for signed_token in signed_tokens),
+            proof.encode_base64(),
+        )
+
+
+@attr.s
+class IssuanceCache(object):
+    """
+    Remember the responses to recent issuance requests so that a client which
+    retries a request gets the same response without the signatures and
+    proof being computed again.
+
+    Giving the same signed tokens and proof in response to the same blinded
+    tokens reveals nothing the client did not already have.
+
+    :ivar LRUCache cache: The storage for responses, keyed by
+        ``issuance_digest``.
+    """
+    cache = attr.ib(default=attr.Factory(lambda: LRUCache(maxsize=1024, ttl=300)))
+
+    def issue(self, signing_key, key_id, marshaled_blinded_tokens):
+        """
+        Sign some blinded tokens, or find the response to an earlier request
+        for the same tokens with the same key.
+
+        :param SigningKey signing_key: The key with which to sign.
+        :param bytes key_id: An identifier which is different for every
+            signing key the cache is used with, for example the
+            base64-encoded ``PublicKey`` of ``signing_key``.  It is part of
+            every cache key, so it should not be secret.
+        :param list[bytes] marshaled_blinded_tokens: The base64-encoded
+            blinded tokens to sign.
+
+        :return: A two-tuple of a ``list`` of the base64-encoded signed
+            tokens and the base64-encoded ``BatchDLEQProof`` for them.
+        """
+        marshaled_blinded_tokens = list(marshaled_blinded_tokens)
+        key = issuance_digest(key_id, marshaled_blinded_tokens)
+        response = self.cache.get(key)
+        if response is None:
+            response = _issue(signing_key, marshaled_blinded_tokens)
+            self.cache.put(key, response)
+        marshaled_signed_tokens, marshaled_proof = response
+        return list(marshaled_signed_tokens), marshaled_proof
+
+    def stats(self):
+        """
+        :return CacheStats: A snapshot of the cache's counters.
+        """
+        return self.cache.stats()
+
+
+@attr.s
+class KeyCache(object):
+    """
+    Map base64-encoded keys to decoded key objects so that a service which
+    is handed the same key on every request decodes it only once.
+
+    The objects returned are shared by every caller and must not be
+    destroyed.  They are never tracked by an ``Arena``, even when first
+    decoded inside one.  Entries which are evicted or invalidated are left
+    alone rather than destroyed since callers may still be using them.
+
+    :ivar LRUCache cache: The storage for decoded keys.
+    """
+    cache = attr.ib(default=attr.Factory(lambda: LRUCache(maxsize=256)))
+
+    def _get(self, cls, encoded, decode):
+        entry = self.cache.get((cls, encoded))
+        if entry is None:
+            with outside_arena():
+                entry = decode(encoded)
+            self.cache.put((cls, encoded), entry)
+        return entry
+
+    def public_key(self, encoded):
+        """
+        :param bytes encoded: A base64-encoded public key.
+
+        :return PublicKey: The decoded key.
+        """
+        (public_key,) = self._get(
+            PublicKey,
+            encoded,
+            lambda encoded: (PublicKey.decode_base64(encoded),),
+        )
+        return public_key
+
+    def signing_key(self, encoded):
+        """
+        :param bytes encoded: A base64-encoded signing key.
+
+        :return: A two-tuple of the decoded ``SigningKey`` and its
+            ``PublicKey``.
+        """
+        def decode(encoded):
+            signing_key = SigningKey.decode_base64(encoded)
+            return (signing_key, PublicKey.from_signing_key(signing_key))
+        return self._get(SigningKey, encoded, decode)
+
+    def invalidate(self, encoded):
+        """
+        Forget the decoded form of a key, for example because it has been
+        rotated out.
+        """
+        self.cache.invalidate((PublicKey, encoded))
+        self.cache.invalidate((SigningKey, encoded))
+
+    def stats(self):
+        """
+        :return CacheStats: A snapshot of the cache's counters.
+        """
+        return self.cache.stats()
+
+
+# The cache shared by everything in this process.
+key_cache = KeyCache()
@@ -0,0 +1,531 @@
+"""
+A command line tool for bulk operations over files of tokens.
+
+Most subcommands read one request per line of JSON (JSON Lines) and write one
+result line per request, in the same order.  ``issue`` and ``verify`` can
+instead read concatenated ``challenge_bypass_ristretto.wire`` containers
+with ``--format binary``.  Requests are read, processed, and written a
+window at a time so memory use does not grow with the size of the input.
+``--jobs`` spreads the requests across that many processes.
+
+Records
+-------
+
+``keygen``
+    Writes ``{"signing_key": ..., "public_key": ...}``.  This is also the
+    format of the ``--signing-key`` and ``--public-key`` files.
+
+``issue``
+    Reads ``{"blinded_tokens": [...]}`` and writes ``{"signed_tokens": [...],
+    "proof": ...}``.  With ``--format binary`` reads issue request containers
+    and writes issue response containers.
+
+``unblind``
+    Reads ``{"tokens": [...], "blinded_tokens": [...], "signed_tokens":
+    [...], "proof": ...}`` and writes ``{"unblinded_tokens": [...]}``.
+
+``redeem``
+    Reads ``{"unblinded_tokens": [...]}`` and writes ``{"passes":
+    [[preimage, signature], ...]}``.
+
+``verify``
+    Reads ``{"passes": [[preimage, signature], ...]}`` and writes
+    ``{"invalid": [...]}`` with ``true`` for each invalid pass.  With
+    ``--format binary`` reads redemption containers.
+
+``redeem`` and ``verify`` records may carry a ``"message"`` which overrides
+``--message``.  A request which cannot be processed produces ``{"error":
+...}`` and makes the exit status 1.  Binary responses cannot hold an error
+so ``issue --format binary`` leaves the response out and writes ``{"error":
+..., "request": ...}``, with the position of the request, to standard error
+instead.
+
+``bench`` runs the whole flow over generated tokens and prints CSV timings.
+
+``tune`` measures the batch operations on this host, saves the chosen chunk
+sizes and thread counts to ``--profile`` and writes them out.  An existing
+profile for this host and ``--slo-ms`` is reused unless ``--force`` is given.
+"""
+
+from argparse import (
+    ArgumentParser,
+    FileType,
+)
+from contextlib import (
+    contextmanager,
+)
+from io import (
+    BytesIO,
+)
+from itertools import (
+    islice,
+)
+from json import (
+    dumps,
+    loads,
+)
+from multiprocessing import (
+    Pool,
+)
+from sys import (
+    stderr,
+    stdin,
+    stdout,
+)
+from time import (
+    time,
+)
+
+from . import (
+    Arena,
+    BatchDLEQProof,
+    BlindedToken,
+    PublicKey,
+    SignedToken,
+    SigningKey,
+    Token,
+    TokenPreimage,
+    UnblindedToken,
+    VerificationKey,
+    VerificationSignature,
+    random_signing_key,
+)
+from .tuning import (
+    calibrate,
+    load_or_calibrate,
+)
+from .wire import (
+    read_issue_request,
+    read_raw_containers,
+    read_redemption,
+    write_issue_response,
+)
+
+# The decoded keys and message for the current process, set up by
+# _initialize in each worker process.
+_state = {}
+
+
+def _encode(native):
+    return native.encode_base64().decode("ascii")
+
+
+def _decode_all(cls, texts):
+    return list(cls.decode_base64(text.encode("ascii")) for text in texts)
+
+
+def _initialize(signing_key, public_key, message):
+    _state.clear()
+    if signing_key is not None:
+        _state["signing_key"] = SigningKey.decode_base64(signing_key)
+    if public_key is not None:
+        _state["public_key"] = PublicKey.decode_base64(public_key)
+    _state["message"] = message
+
+
+def _message(request):
+    if "message" in request:
+        return request["message"].encode("utf-8")
+    if _state["message"] is None:
+        raise ValueError("no message given")
+    return _state["message"]
+
+
+def _issue(blinded_tokens):
+    signing_key = _state["signing_key"]
+    signed_tokens = list(map(signing_key.sign, blinded_tokens))
+    proof = BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens)
+    return signed_tokens, proof
+
+
+def _verify(message, passes):
+    signing_key = _state["signing_key"]
+    keys = list(
+        signing_key.rederive_unblinded_token(
+            token_preimage,
+        ).derive_verification_key_sha512()
+        for (token_preimage, _)
+        in passes
+    )
+    bitmap = VerificationKey.invalid_sha512_many(
+        keys,
+        list(signature for (_, signature) in passes),
+        message,
+    )
+    return list(bool(bitmap >> n & 1) for n in range(len(passes)))
+
+
+def issue_json(request):
+    signed_tokens, proof = _issue(
+        _decode_all(BlindedToken, request["blinded_tokens"]),
+    )
+    return {
+        "signed_tokens": list(map(_encode, signed_tokens)),
+        "proof": _encode(proof),
+    }
+
+
+def issue_binary(container):
+    signed_tokens, proof = _issue(read_issue_request(BytesIO(container)))
+    output = BytesIO()
+    write_issue_response(output, signed_tokens, proof)
+    return output.getvalue()
+
+
+def unblind_json(request):
+    unblinded_tokens = BatchDLEQProof.decode_base64(
+        request["proof"].encode("ascii"),
+    ).invalid_or_unblind(
+        _decode_all(Token, request["tokens"]),
+        _decode_all(BlindedToken, request["blinded_tokens"]),
+        _decode_all(SignedToken, request["signed_tokens"]),
+        _state["public_key"],
+    )
+    return {"unblinded_tokens": list(map(_encode, unblinded_tokens))}
+
+
+def redeem_json(request):
+    message = _message(request)
+    return {
+        "passes": list(
+            [
+                _encode(unblinded_token.preimage()),
+                _encode(unblinded_token.derive_verification_key_sha512().sign_sha512(message)),
+            ]
+            for unblinded_token
+            in _decode_all(UnblindedToken, request["unblinded_tokens"])
+        ),
+    }
+
+
+def verify_json(request):
+    return {
+        "invalid": _verify(
+            _message(request),
+            list(
+                (
+                    TokenPreimage.decode_base64(token_preimage.encode("ascii")),
+                    VerificationSignature.decode_base64(signature.encode("ascii")),
+                )
+                for (token_preimage, signature)
+                in request["passes"]
+            ),
+        ),
+    }
+
+
+def verify_binary(container):
+    return {
+        "invalid": _verify(
+            _message({}),
+            read_redemption(BytesIO(container)),
+        ),
+    }
+
+
+def _json_line(value):
+    return dumps(value).encode("utf-8") + b"\n"
+
+
+def _error(e):
+    return {"error": "{}: {}".format(type(e).__name__, e)}
+
+
+def _error_line(e):
+    return _json_line(_error(e))
+
+
+def _json_worker(f):
+    def worker(line):
+        try:
+            with Arena():
+                return True, _json_line(f(loads(line)))
+        except Exception as e:
+            return False, _error_line(e)
+    return worker
+
+
+def _binary_worker(f, json_output):
+    def worker(container):
+        try:
+            with Arena():
+                result = f(container)
+        except Exception as e:
+            if json_output:
+                return False, _error_line(e)
+            # There is no way to represent an error in a binary response so
+            # ``process`` reports it elsewhere.
+            return False, _error(e)
+        if json_output:
+            return True, _json_line(result)
+        return True, result
+    return worker
+
+
+# The workers whose results are binary and so cannot hold an error record.
+_BINARY_RESULTS = {"issue-binary"}
+
+# Workers are looked up by name in the worker processes so that only the
+# name needs to be pickled.
+_WORKERS = {
+    "issue-jsonl": _json_worker(issue_json),
+    "issue-binary": _binary_worker(issue_binary, json_output=False),
+    "unblind-jsonl": _json_worker(unblind_json),
+    "redeem-jsonl": _json_worker(redeem_json),
+    "verify-jsonl": _json_worker(verify_json),
+    "verify-binary": _binary_worker(verify_binary, json_output=True),
+}
+
+
+def _run_worker(name_and_item):
+    name, item = name_and_item
+    return _WORKERS[name](item)
+
+
+def _windows(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        window = list(islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+@contextmanager
+def _mapper(jobs, initargs):
+    """
+    Get a function like ``map`` which runs ``_run_worker`` in ``jobs``
+    processes, or in this process if ``jobs`` is 1.
+    """
+    if jobs == 1:
+        _initialize(*initargs)
+        yield lambda f, items: list(map(f, items))
+    else:
+        pool = Pool(jobs, _initialize, initargs)
+        try:
+            yield pool.map
+        finally:
+            pool.close()
+            pool.join()
+
+
+def process(name, items, output, jobs=1, window=None, initargs=(None, None, None), errors=None):
+    """
+    Apply one of the named workers to each of ``items`` and write the results
+    to ``output`` in order.  For a worker with binary results the result of a
+    failed request is left out and an error record with the request's
+    position is written to ``errors`` instead.
+
+    :param str name: The worker to use, such as ``"issue-jsonl"``.
+    :param items: An iterable of the requests (lines or containers).
+    :param output: A binary file-like object for the results.
+    :param int jobs: The number of processes to use.
+    :param int window: The number of requests to hold in memory at once.
+        Defaults to 16 for each job.
+    :param initargs: The signing key, public key, and message, each encoded
+        or ``None``.
+    :param errors: A binary file-like object for the errors of a worker with
+        binary results.  Defaults to standard error.
+
+    :return int: The number of requests which failed.
+    """
+    if window is None:
+        window = 16 * jobs
+    if errors is None:
+        errors = getattr(stderr, "buffer", stderr)
+    failures = 0
+    position = 0
+    with _mapper(jobs, initargs) as mapper:
+        for items_window in _windows(((name, item) for item in items), window):
+            for (ok, result) in mapper(_run_worker, items_window):
+                if not ok:
+                    failures += 1
+                    if name in _BINARY_RESULTS:
+                        errors.write(_json_line(dict(result, request=position)))
+                        result = b""
+                output.write(result)
+                position += 1
+    return failures
+
+
+def _read_key(key_file, field):
+    with key_file:
+        return loads(key_file.read())[field].encode("ascii")
+
+
+def keygen(options):
+    signing_key = random_signing_key()
+    options.output.write(_json_line({
+        "signing_key": _encode(signing_key),
+        "public_key": _encode(PublicKey.from_signing_key(signing_key)),
+    }))
+    return 0
+
+
+def _lines(stream):
+    return (line for line in stream if line.strip())
+
+
+def _command(name, needs_signing_key=False, needs_public_key=False):
+    def command(options):
+        fmt = getattr(options, "format", "jsonl")
+        if fmt == "binary":
+            items = read_raw_containers(options.input)
+        else:
+            items = _lines(options.input)
+        failures = process(
+            "{}-{}".format(name, fmt),
+            items,
+            options.output,
+            jobs=options.jobs,
+            initargs=(
+                _read_key(options.signing_key, "signing_key") if needs_signing_key else None,
+                _read_key(options.public_key, "public_key") if needs_public_key else None,
+                None if getattr(options, "message", None) is None else options.message.encode("utf-8"),
+            ),
+        )
+        return 1 if failures else 0
+    return command
+
+
+def bench(options):
+    """
+    Time each step of the protocol for ``options.count`` tokens split into
+    requests of ``options.batch_size`` tokens.
+    """
+    message = b"bench"
+    signing_key = random_signing_key()
+    initargs = (
+        signing_key.encode_base64(),
+        PublicKey.from_signing_key(signing_key).encode_base64(),
+        message,
+    )
+
+    def run(label, name, requests):
+        output = BytesIO()
+        before = time()
+        process(
+            name,
+            (dumps(request).encode("utf-8") for request in requests),
+            output,
+            jobs=options.jobs,
+            initargs=initargs,
+        )
+        after = time()
+        options.output.write("{},{},{},{:0.2f}\n".format(
+            label,
+            options.count,
+            options.jobs,
+            (after - before) * 1000,
+        ).encode("ascii"))
+        return list(map(loads, output.getvalue().splitlines()))
+
+    options.output.write(b"label,count,jobs,milliseconds\n")
+    sizes = [options.batch_size] * (options.count // options.batch_size)
+    if options.count % options.batch_size:
+        sizes.append(options.count % options.batch_size)
+    with Arena():
+        requests = list(
+            dict(
+                tokens=list(map(_encode, tokens)),
+                blinded_tokens=list(map(_encode, blinded_tokens)),
+            )
+            for (tokens, blinded_tokens)
+            in (Token.create_and_blind_many(size) for size in sizes)
+        )
+    issued = run("issue", "issue-jsonl", requests)
+    unblinded = run("unblind", "unblind-jsonl", list(
+        dict(request, **response)
+        for (request, response)
+        in zip(requests, issued)
+    ))
+    redeemed = run("redeem", "redeem-jsonl", unblinded)
+    run("verify", "verify-jsonl", redeemed)
+    return 0
+
+
+def tune(options):
+    slo = options.slo_ms / 1000
+    if options.force:
+        profile = calibrate(slo=slo)
+        profile.save(options.profile)
+    else:
+        profile = load_or_calibrate(options.profile, slo=slo)
+    options.output.write(profile.to_json().encode("utf-8") + b"\n")
+    return 0
+
+
+def _parser():
+    parser = ArgumentParser(
+        prog="python -m challenge_bypass_ristretto",
+        description="Bulk Privacy Pass operations over files of tokens.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    def add(name, f):
+        sub = subparsers.add_parser(name)
+        sub.set_defaults(f=f)
+        sub.add_argument("--output", "-o", type=FileType("wb"))
+        return sub
+
+    def add_bulk(name, f, formats=("jsonl",)):
+        sub = add(name, f)
+        sub.add_argument("--jobs", "-j", type=int, default=1)
+        sub.add_argument("--input", "-i", type=FileType("rb"))
+        if len(formats) > 1:
+            sub.add_argument("--format", choices=formats, default="jsonl")
+        return sub
+
+    add("keygen", keygen)
+
+    sub = add_bulk("issue", _command("issue", needs_signing_key=True), ("jsonl", "binary"))
+    sub.add_argument("--signing-key", type=FileType("rb"), required=True)
+
+    sub = add_bulk("unblind", _command("unblind", needs_public_key=True))
+    sub.add_argument("--public-key", type=FileType("rb"), required=True)
+
+    sub = add_bulk("redeem", _command("redeem"))
+    sub.add_argument("--message")
+
+    sub = add_bulk("verify", _command("verify", needs_signing_key=True), ("jsonl", "binary"))
+    sub.add_argument("--signing-key", type=FileType("rb"), required=True)
+    sub.add_argument("--message")
+
+    sub = add("bench", bench)
+    sub.add_argument("--jobs", "-j", type=int, default=1)
+    sub.add_argument("--count", type=int, default=1000)
+    sub.add_argument("--batch-size", type=int, default=100)
+
+    sub = add("tune", tune)
+    sub.add_argument("--profile", required=True)
+    sub.add_argument("--slo-ms", type=float, default=10.0)
+    sub.add_argument("--force", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the command line tool.
+
+    :return int: The exit status.
+    """
+    options = _parser().parse_args(argv)
+    if getattr(options, "jobs", 1) < 1:
+        raise SystemExit("--jobs must be at least 1")
+    # Close the files argparse opened, and only those, once done.
+    opened = list(
+        f
+        for f in (options.output, getattr(options, "input", None))
+        if f is not None
+    )
+    if options.output is None:
+        options.output = getattr(stdout, "buffer", stdout)
+    if getattr(options, "input", False) is None:
+        options.input = getattr(stdin, "buffer", stdin)
+    try:
+        return options.f(options)
+    finally:
+        options.output.flush()
+        for f in opened:
+            f.close()
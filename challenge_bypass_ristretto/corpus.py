@@ -0,0 +1,259 @@
+"""
+A corpus of precomputed keys, tokens, signatures, proofs and passes for
+fast and reproducible tests and benchmarks.
+
+Everything in a corpus except the proofs is derived from a seed with
+``seeded_random_bytes`` so ``generate`` with the same seed always makes the
+same objects.  The proofs are randomized by the native library; the copies
+saved in a corpus file are what make them reproducible.
+
+A corpus file starts with::
+
+    magic   4 bytes   b"CBRV"
+    version 1 byte    currently 1
+    message           a field holding the message the passes are for
+    sets    2 bytes   big-endian number of key sets
+
+followed by each key set::
+
+    signing key       a field
+    count   4 bytes   big-endian number of tokens
+    tokens            ``count`` fields
+    blinded tokens    an ISSUE_REQUEST container
+    signed tokens     an ISSUE_RESPONSE container, with the proof
+    unblinded tokens  ``count`` fields
+    passes            a REDEMPTION container
+
+Containers and fields are as in ``challenge_bypass_ristretto.wire``.
+
+To write a corpus next to this module, where ``load`` finds it by default::
+
+    python -m challenge_bypass_ristretto.corpus
+"""
+
+from base64 import (
+    b64decode,
+    b64encode,
+)
+from os.path import (
+    dirname,
+    join,
+)
+from struct import (
+    Struct,
+)
+from sys import (
+    argv,
+)
+
+import attr
+
+from . import (
+    BatchDLEQProof,
+    DecodeException,
+    Token,
+    UnblindedToken,
+    SigningKey,
+    random_signing_key,
+    seeded_random_bytes,
+)
+from .wire import (
+    WireFormatException,
+    _LENGTH,
+    _read_exactly,
+    read_issue_request,
+    read_issue_response,
+    read_redemption,
+    write_issue_request,
+    write_issue_response,
+    write_redemption,
+)
+
+MAGIC = b"CBRV"
+VERSION = 1
+
+SEED = b"challenge-bypass-ristretto golden vectors"
+MESSAGE = b"golden vectors"
+
+DEFAULT_PATH = join(dirname(__file__), "corpus.bin")
+
+_HEADER = Struct(">4sB")
+_SETS = Struct(">H")
+_COUNT = Struct(">I")
+
+
+@attr.s
+class KeySet(object):
+    """
+    Everything made from one signing key, in matching order.
+
+    :ivar SigningKey signing_key: The key.
+    :ivar list tokens: The ``Token`` instances.
+    :ivar list blinded_tokens: The ``BlindedToken`` for each token.
+    :ivar list signed_tokens: The ``SignedToken`` for each blinded token.
+    :ivar BatchDLEQProof proof: The proof for all of the signed tokens.
+    :ivar list unblinded_tokens: The ``UnblindedToken`` for each token.
+    :ivar list passes: A ``(TokenPreimage, VerificationSignature)`` pair for
+        each unblinded token, signing the corpus message.
+    """
+    signing_key = attr.ib()
+    tokens = attr.ib()
+    blinded_tokens = attr.ib()
+    signed_tokens = attr.ib()
+    proof = attr.ib()
+    unblinded_tokens = attr.ib()
+    passes = attr.ib()
+
+
+@attr.s
+class Corpus(object):
+    """
+    :ivar bytes message: The message the passes are for.
+    :ivar list key_sets: The ``KeySet`` instances.
+    """
+    message = attr.ib()
+    key_sets = attr.ib()
+
+
+def _key_set(signing_key, tokens, message):
+    blinded_tokens = Token.blind_many(tokens)
+    signed_tokens = list(map(signing_key.sign, blinded_tokens))
+    unblinded_tokens = Token.unblind_many(tokens, signed_tokens)
+    return KeySet(
+        signing_key=signing_key,
+        tokens=tokens,
+        blinded_tokens=blinded_tokens,
+        signed_tokens=signed_tokens,
+        proof=BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens),
+        unblinded_tokens=unblinded_tokens,
+        passes=list(
+            (
+                unblinded_token.preimage(),
+                unblinded_token.derive_verification_key_sha512().sign_sha512(message),
+            )
+            for unblinded_token
+            in unblinded_tokens
+        ),
+    )
+
+
+def generate(seed=SEED, key_count=2, token_count=16, message=MESSAGE):
+    """
+    Make a corpus.
+
+    :param bytes seed: The seed from which the keys and tokens are derived.
+    :param int key_count: The number of key sets to make.
+    :param int token_count: The number of tokens in each key set.
+    :param bytes message: The message to sign in the passes.
+
+    :return Corpus: The new corpus.
+    """
+    random_bytes = seeded_random_bytes(seed)
+    return Corpus(
+        message=message,
+        key_sets=list(
+            _key_set(
+                random_signing_key(random_bytes),
+                Token.create_many(token_count, random_bytes),
+                message,
+            )
+            for _ in range(key_count)
+        ),
+    )
+
+
+def _write_field(stream, raw):
+    stream.write(_LENGTH.pack(len(raw)))
+    stream.write(raw)
+
+
+def _read_field(stream):
+    (length,) = _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))
+    return _read_exactly(stream, length)
+
+
+def _write_native(stream, native):
+    _write_field(stream, b64decode(native.encode_base64()))
+
+
+def _read_native(stream, cls):
+    return cls.decode_base64(b64encode(_read_field(stream)))
+
+
+def write(stream, corpus):
+    """
+    Write a corpus to a binary file-like object.
+    """
+    stream.write(_HEADER.pack(MAGIC, VERSION))
+    _write_field(stream, corpus.message)
+    stream.write(_SETS.pack(len(corpus.key_sets)))
+    for key_set in corpus.key_sets:
+        _write_native(stream, key_set.signing_key)
+        stream.write(_COUNT.pack(len(key_set.tokens)))
+        for token in key_set.tokens:
+            _write_native(stream, token)
+        write_issue_request(stream, key_set.blinded_tokens)
+        write_issue_response(stream, key_set.signed_tokens, key_set.proof)
+        for unblinded_token in key_set.unblinded_tokens:
+            _write_native(stream, unblinded_token)
+        write_redemption(stream, key_set.passes)
+
+
+def read(stream):
+    """
+    Read a corpus from a binary file-like object.
+
+    :raise DecodeException: If the corpus is malformed.
+
+    :return Corpus: The corpus.
+    """
+    magic, version = _HEADER.unpack(_read_exactly(stream, _HEADER.size))
+    if magic != MAGIC:
+        raise WireFormatException("not a token corpus")
+    if version != VERSION:
+        raise WireFormatException("unsupported corpus version {}".format(version))
+    message = _read_field(stream)
+    (set_count,) = _SETS.unpack(_read_exactly(stream, _SETS.size))
+    key_sets = []
+    for _ in range(set_count):
+        signing_key = _read_native(stream, SigningKey)
+        (count,) = _COUNT.unpack(_read_exactly(stream, _COUNT.size))
+        tokens = list(_read_native(stream, Token) for _ in range(count))
+        blinded_tokens = read_issue_request(stream)
+        signed_tokens, proof = read_issue_response(stream)
+        unblinded_tokens = list(_read_native(stream, UnblindedToken) for _ in range(count))
+        passes = read_redemption(stream)
+        if not len(blinded_tokens) == len(signed_tokens) == len(passes) == count:
+            raise DecodeException("corpus key set has mismatched lengths")
+        key_sets.append(KeySet(
+            signing_key=signing_key,
+            tokens=tokens,
+            blinded_tokens=blinded_tokens,
+            signed_tokens=signed_tokens,
+            proof=proof,
+            unblinded_tokens=unblinded_tokens,
+            passes=passes,
+        ))
+    return Corpus(message=message, key_sets=key_sets)
+
+
+def load(path=DEFAULT_PATH):
+    """
+    Read the corpus file at ``path``, by default the one ``main`` writes
+    next to this module.
+    """
+    with open(path, "rb") as f:
+        return read(f)
+
+
+def save(path, corpus):
+    with open(path, "wb") as f:
+        write(f, corpus)
+
+
+def main(path=DEFAULT_PATH):
+    save(path, generate())
+
+
+if __name__ == "__main__":
+    main(*argv[1:])
@@ -0,0 +1,252 @@
+"""
+Accounting of the native objects held by this process.
+
+Native objects are only released by ``destroy`` (directly or through an
+``Arena``).  A wrapper which is garbage collected without being destroyed
+leaks its native object, so it still counts as live here.  That makes this
+module useful for finding leaks as well as for sizing.
+
+Accounting is off by default and costs one global lookup per wrapper when it
+is off.  For example::
+
+    from challenge_bypass_ristretto import diagnostics
+    diagnostics.enable(track_sites=True)
+    ...
+    for (usage_type, usage) in sorted(diagnostics.snapshot().items()):
+        print(usage_type, usage.live, usage.estimated_bytes)
+    for site in diagnostics.top_sites(limit=5):
+        print(site.count, site.traceback[-1])
+"""
+
+from threading import (
+    Lock,
+)
+from traceback import (
+    extract_stack,
+)
+
+import attr
+
+from . import (
+    _set_tracker,
+    ffi,
+)
+
+# Approximate in-memory sizes, in bytes, of the Rust value behind each
+# wrapper type, not of its encoding.  A RistrettoPoint is held uncompressed as
+# four field elements of 40 bytes each and a Scalar is 32 bytes.  Allocator
+# overhead is not included.
+_POINT = 160
+_SCALAR = 32
+_PREIMAGE = 64
+
+NATIVE_SIZES = {
+    "Token": _PREIMAGE + _SCALAR,
+    "BlindedToken": _POINT,
+    "SignedToken": _POINT,
+    "UnblindedToken": _PREIMAGE + _POINT,
+    "TokenPreimage": _PREIMAGE,
+    "VerificationKey": 64,
+    "VerificationSignature": 64,
+    "SigningKey": _POINT + _SCALAR,
+    "PublicKey": _POINT,
+    "BatchDLEQProof": 2 * _SCALAR,
+}
+
+
+@attr.s(frozen=True)
+class TypeUsage(object):
+    """
+    The native objects of one wrapper type.
+
+    :ivar int live: The number allocated and not yet destroyed.
+    :ivar int high_water: The largest value ``live`` has had.
+    :ivar int allocated: The number allocated since accounting was enabled.
+    :ivar int destroyed: The number destroyed since accounting was enabled.
+    :ivar int estimated_bytes: The approximate native memory used by the
+        live objects.
+    """
+    live = attr.ib()
+    high_water = attr.ib()
+    allocated = attr.ib()
+    destroyed = attr.ib()
+    estimated_bytes = attr.ib()
+
+
+@attr.s(frozen=True)
+class AllocationSite(object):
+    """
+    A place from which live native objects were allocated.
+
+    :ivar list traceback: ``(filename, line number, function name)`` for each
+        frame of the allocation's stack, outermost first.
+    :ivar int count: The number of live objects allocated there.
+    :ivar int estimated_bytes: The approximate native memory they use.
+    """
+    traceback = attr.ib()
+    count = attr.ib()
+    estimated_bytes = attr.ib()
+
+
+def _address(native):
+    return int(ffi.cast("uintptr_t", native._raw))
+
+
+@attr.s
+class _Counts(object):
+    live = attr.ib(default=0)
+    high_water = attr.ib(default=0)
+    allocated = attr.ib(default=0)
+    destroyed = attr.ib(default=0)
+
+
+@attr.s
+class _Tracker(object):
+    track_sites = attr.ib()
+    site_depth = attr.ib()
+
+    _lock = attr.ib(init=False, default=attr.Factory(Lock))
+    _counts = attr.ib(init=False, default=attr.Factory(dict))
+    # Map the address of each live native object to its type name and
+    # allocation site.
+    _live = attr.ib(init=False, default=attr.Factory(dict))
+
+    def allocated(self, native):
+        name = type(native).__name__
+        site = None
+        if self.track_sites:
+            # Leave out this frame and the wrapper's __init__ frames.
+            site = tuple(
+                (frame.filename, frame.lineno, frame.name)
+                for frame
+                in extract_stack(limit=self.site_depth + 3)[:-3]
+            )
+        address = _address(native)
+        with self._lock:
+            counts = self._counts.setdefault(name, _Counts())
+            counts.allocated += 1
+            counts.live += 1
+            counts.high_water = max(counts.high_water, counts.live)
+            self._live[address] = (name, site)
+
+    def destroyed(self, native):
+        address = _address(native)
+        with self._lock:
+            # Objects allocated before accounting was enabled are unknown.
+            name, _ = self._live.pop(address, (None, None))
+            if name is not None:
+                counts = self._counts[name]
+                counts.destroyed += 1
+                counts.live -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                (name, TypeUsage(
+                    live=counts.live,
+                    high_water=counts.high_water,
+                    allocated=counts.allocated,
+                    destroyed=counts.destroyed,
+                    estimated_bytes=counts.live * NATIVE_SIZES.get(name, 0),
+                ))
+                for (name, counts)
+                in self._counts.items()
+            )
+
+    def reset_high_water(self):
+        with self._lock:
+            for counts in self._counts.values():
+                counts.high_water = counts.live
+
+    def sites(self):
+        with self._lock:
+            live = list(self._live.values())
+        by_site = {}
+        for (name, site) in live:
+            if site is not None:
+                count, size = by_site.get(site, (0, 0))
+                by_site[site] = (count + 1, size + NATIVE_SIZES.get(name, 0))
+        return by_site
+
+
+_current = None
+
+
+def enable(track_sites=False, site_depth=8):
+    """
+    Start accounting for native objects allocated from now on, discarding any
+    earlier accounting.
+
+    :param bool track_sites: If ``True``, also record the stack from which
+        each object is allocated.  This is much more expensive than counting
+        alone.
+    :param int site_depth: The number of frames to record for each site.
+    """
+    global _current
+    _current = _Tracker(track_sites, site_depth)
+    _set_tracker(_current)
+
+
+def disable():
+    """
+    Stop accounting and discard what has been recorded.
+    """
+    global _current
+    _current = None
+    _set_tracker(None)
+
+
+def is_enabled():
+    return _current is not None
+
+
+def _tracker():
+    if _current is None:
+        raise ValueError("diagnostics are not enabled")
+    return _current
+
+
+def snapshot():
+    """
+    :return: A ``dict`` mapping wrapper type names to ``TypeUsage`` for each
+        type allocated since accounting was enabled.
+    """
+    return _tracker().snapshot()
+
+
+def total_estimated_bytes():
+    """
+    :return int: The approximate native memory used by all live objects.
+    """
+    return sum(usage.estimated_bytes for usage in snapshot().values())
+
+
+def reset_high_water():
+    """
+    Set the high water mark of every type to its current live count.
+    """
+    _tracker().reset_high_water()
+
+
+def top_sites(limit=10):
+    """
+    Find the places which allocated the most live native objects.  This
+    requires accounting to have been enabled with ``track_sites=True``.
+
+    :param int limit: The most sites to return.
+
+    :return: A ``list`` of ``AllocationSite``, most objects first.
+    """
+    return sorted(
+        (
+            AllocationSite(
+                traceback=list(site),
+                count=count,
+                estimated_bytes=size,
+            )
+            for (site, (count, size))
+            in _tracker().sites().items()
+        ),
+        key=lambda site: site.count,
+        reverse=True,
+    )[:limit]
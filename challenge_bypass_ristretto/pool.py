@@ -0,0 +1,190 @@
+"""
+Pre-generation of ``Token`` / ``BlindedToken`` pairs.
+
+Creating and blinding tokens does not depend on anything the server says so a
+client can do it ahead of time, off of the latency-sensitive path of asking
+for a new voucher.
+"""
+
+from collections import (
+    deque,
+)
+from threading import (
+    Condition,
+    Thread,
+)
+
+import attr
+
+from . import (
+    Token,
+    outside_arena,
+)
+
+
+def _generate_pairs(count):
+    return list(zip(*Token.create_and_blind_many(count)))
+
+
+@attr.s
+class PoolStats(object):
+    """
+    Counters describing how well a ``TokenPool`` is keeping up with demand.
+
+    :ivar int available: The number of pairs in the pool right now.
+    :ivar int hits: The number of pairs handed out straight from the pool.
+    :ivar int misses: The number of pairs which had to be generated on demand
+        because the pool ran dry.
+    :ivar int generated: The number of pairs generated ahead of time, either
+        by the background thread or by ``TokenPool.fill``.
+    """
+    available = attr.ib(default=0)
+    hits = attr.ib(default=0)
+    misses = attr.ib(default=0)
+    generated = attr.ib(default=0)
+
+
+@attr.s
+class TokenPool(object):
+    """
+    Keep a supply of ``(Token, BlindedToken)`` pairs which are generated on a
+    background thread so that callers can take them without waiting.
+
+    Refilling uses two marks.  Once the pool drops to ``low_water`` pairs or
+    fewer the background thread generates pairs, ``batch_size`` at a time,
+    until the pool holds ``high_water`` pairs and then goes back to sleep.
+
+    :ivar int high_water: The number of pairs to generate up to.
+    :ivar int low_water: The number of pairs at or below which to start
+        generating more.
+    :ivar int batch_size: The number of pairs to generate between checks of
+        the pool.  Larger batches mean less locking but a longer wait before
+        new pairs become visible.
+    """
+    high_water = attr.ib(default=1024)
+    low_water = attr.ib(default=256)
+    batch_size = attr.ib(default=64)
+
+    _pairs = attr.ib(init=False, default=attr.Factory(deque))
+    _stats = attr.ib(init=False, default=attr.Factory(PoolStats))
+    _condition = attr.ib(init=False, default=attr.Factory(Condition))
+    _refilling = attr.ib(init=False, default=True)
+    _stopping = attr.ib(init=False, default=False)
+    _thread = attr.ib(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        if not 0 <= self.low_water < self.high_water:
+            raise ValueError(
+                "TokenPool requires 0 <= low_water < high_water, got {} and {}".format(
+                    self.low_water,
+                    self.high_water,
+                ),
+            )
+        if self.batch_size < 1:
+            raise ValueError("TokenPool requires a positive batch_size")
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pairs)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Start generating pairs on a background thread.
+        """
+        with self._condition:
+            if self._thread is not None:
+                raise ValueError("TokenPool is already started")
+            self._stopping = False
+            self._thread = Thread(
+                target=self._run,
+                name="TokenPool",
+            )
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, waiting for any batch in progress to be
+        finished.  Pairs already in the pool remain available to ``take``.
+        """
+        with self._condition:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+        thread.join()
+        with self._condition:
+            self._thread = None
+
+    def fill(self):
+        """
+        Generate pairs on the calling thread until the pool is at its high
+        water mark.  This is useful to warm up the pool before the first
+        request.  The pairs belong to the pool, not to any ``Arena`` active on
+        the calling thread.
+        """
+        with self._condition:
+            missing = self.high_water - len(self._pairs)
+        if missing > 0:
+            with outside_arena():
+                pairs = _generate_pairs(missing)
+            self._add(pairs)
+
+    def take(self, count):
+        """
+        Take some pairs from the pool.
+
+        :param int count: The number of pairs to take.  If the pool does not
+            have this many then the shortfall is generated on the calling
+            thread.
+
+        :return: A ``list`` of ``count`` two-tuples of ``Token`` and the
+            ``BlindedToken`` made from it.
+        """
+        with self._condition:
+            available = min(count, len(self._pairs))
+            pairs = list(self._pairs.popleft() for _ in range(available))
+            self._stats.hits += available
+            self._stats.misses += count - available
+            if len(self._pairs) <= self.low_water:
+                self._refilling = True
+                self._condition.notify_all()
+        if available < count:
+            pairs.extend(_generate_pairs(count - available))
+        return pairs
+
+    def stats(self):
+        """
+        :return PoolStats: A snapshot of the pool's counters.
+        """
+        with self._condition:
+            return attr.evolve(self._stats, available=len(self._pairs))
+
+    def _add(self, pairs):
+        with self._condition:
+            self._pairs.extend(pairs)
+            self._stats.generated += len(pairs)
+            if len(self._pairs) >= self.high_water:
+                self._refilling = False
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and not self._refilling:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                count = min(self.batch_size, self.high_water - len(self._pairs))
+            if count > 0:
+                self._add(_generate_pairs(count))
+            else:
+                with self._condition:
+                    self._refilling = False
@@ -0,0 +1,158 @@
+"""
+Routing of redemptions to the workers which own the spent-token state for
+them.
+
+Each worker keeps the spent set for a slice of the preimage digest space.
+``HashRing`` decides which worker owns a digest using consistent hashing,
+so adding or removing a worker moves only the slice next to it, and
+``Router`` splits a batch of passes by owner and puts the workers' answers
+back in the order of the batch.
+"""
+
+from bisect import (
+    bisect,
+)
+from hashlib import (
+    blake2b,
+)
+
+import attr
+
+from .spent import (
+    preimage_digest,
+)
+
+
+def _point(data):
+    return int.from_bytes(data[:8], "big")
+
+
+@attr.s
+class HashRing(object):
+    """
+    A consistent hash ring of workers.
+
+    :ivar list workers: The workers, each identified by a ``str``.
+    :ivar int replicas: The number of points each worker has on the ring.
+        More points spread the digest space more evenly.
+    """
+    workers = attr.ib(converter=list)
+    replicas = attr.ib(default=64)
+
+    _points = attr.ib(init=False)
+    _owners = attr.ib(init=False)
+
+    def __attrs_post_init__(self):
+        if not self.workers:
+            raise ValueError("HashRing requires at least one worker")
+        self._build()
+
+    def _build(self):
+        ring = sorted(
+            (
+                _point(blake2b(
+                    "{}#{}".format(worker, n).encode("utf-8"),
+                    digest_size=8,
+                ).digest()),
+                worker,
+            )
+            for worker
+            in self.workers
+            for n
+            in range(self.replicas)
+        )
+        self._points = list(point for (point, _) in ring)
+        self._owners = list(worker for (_, worker) in ring)
+
+    def add(self, worker):
+        self.workers.append(worker)
+        self._build()
+
+    def remove(self, worker):
+        if len(self.workers) == 1:
+            raise ValueError("HashRing requires at least one worker")
+        self.workers.remove(worker)
+        self._build()
+
+    def owner(self, digest):
+        """
+        :param bytes digest: A digest of at least 8 bytes, such as one from
+            ``preimage_digest``.
+
+        :return: The worker which owns ``digest``.
+        """
+        index = bisect(self._points, _point(digest))
+        return self._owners[index % len(self._owners)]
+
+
+def _pass_digest(redemption_pass):
+    token_preimage, _ = redemption_pass
+    return preimage_digest(token_preimage)
+
+
+@attr.s
+class Router(object):
+    """
+    Split batches of passes between the workers of a ``HashRing``.
+
+    For example::
+
+        router = Router(HashRing(["a", "b", "c"]))
+        batches = router.partition(passes)
+        results = {
+            worker: send(worker, items)
+            for (worker, (_, items))
+            in batches.items()
+        }
+        invalid = router.gather(len(passes), batches, results)
+
+    :ivar HashRing ring: The workers.
+    :ivar digest: A function giving the digest of an item.  By default items
+        are ``(TokenPreimage, VerificationSignature)`` pairs and are routed
+        by ``preimage_digest`` of the preimage.
+    """
+    ring = attr.ib()
+    digest = attr.ib(default=_pass_digest)
+
+    def partition(self, items):
+        """
+        Split a batch by owner.
+
+        :return dict: A mapping from each worker with something to do to a
+            two-tuple of the positions of its items in the batch and a list
+            of the items themselves.
+        """
+        batches = {}
+        owner = self.ring.owner
+        digest = self.digest
+        for (n, item) in enumerate(items):
+            positions, owned = batches.setdefault(owner(digest(item)), ([], []))
+            positions.append(n)
+            owned.append(item)
+        return batches
+
+    def gather(self, count, batches, results):
+        """
+        Put per-worker results back in the order of the original batch.
+
+        :param int count: The number of items in the original batch.
+        :param dict batches: The result of ``partition`` for the batch.
+        :param dict results: A mapping from each worker in ``batches`` to a
+            list with one result for each of its items, in the same order.
+
+        :return list: The results in the order of the original batch.
+        """
+        gathered = [None] * count
+        for (worker, (positions, _)) in batches.items():
+            worker_results = results[worker]
+            if len(worker_results) != len(positions):
+                raise ValueError(
+                    "worker {} gave {} results for {} items".format(
+                        worker,
+                        len(worker_results),
+                        len(positions),
+                    ),
+                )
+            for (position, result) in zip(positions, worker_results):
+                gathered[position] = result
+        return gathered
@@ -0,0 +1,357 @@
+"""
+Sharing of key material and token batches between processes through
+``multiprocessing.shared_memory``.
+
+Native objects live on the heap of the process which made them and cannot
+be placed in shared memory themselves.  What can be shared is their compact
+encoding: a parent process puts a batch of tokens or the current signing key
+into a segment once and every worker attaches to it by name, reads records
+in place without copying them, and decodes only what it uses.
+
+For example, in the parent::
+
+    keyring = SharedSigningKey.create(signing_key)
+    batch = SharedBatch.create(blinded_tokens)
+    ... hand keyring.name and batch.name to the workers ...
+    keyring.rotate(random_signing_key())
+
+and in each worker::
+
+    keyring = SharedSigningKey.attach(keyring_name)
+    batch = SharedBatch.attach(batch_name)
+    with keyring.current() as keys:
+        signed = list(map(keys.signing_key.sign, batch.decode_all()))
+"""
+
+from base64 import (
+    b64decode,
+    b64encode,
+)
+from contextlib import (
+    contextmanager,
+)
+from struct import (
+    Struct,
+)
+from threading import (
+    Lock,
+)
+
+import attr
+
+from . import (
+    BatchDLEQProof,
+    BlindedToken,
+    DecodeException,
+    PublicKey,
+    SignedToken,
+    SigningKey,
+    Token,
+    TokenPreimage,
+    UnblindedToken,
+    VerificationSignature,
+    outside_arena,
+)
+
+_VERSION = 1
+
+# The wrapper types which can be shared, identified in segment headers by
+# their position here.  Only append to this.
+_TYPES = (
+    BlindedToken,
+    SignedToken,
+    TokenPreimage,
+    VerificationSignature,
+    UnblindedToken,
+    Token,
+    SigningKey,
+    PublicKey,
+    BatchDLEQProof,
+)
+
+_BATCH_HEADER = Struct(">4sBBHI")
+_BATCH_MAGIC = b"CBRB"
+
+# The generation is a sequence lock: it is odd while a writer is changing
+# the key and even otherwise.
+_KEY_HEADER = Struct(">4sBxxxQH")
+_KEY_MAGIC = b"CBRK"
+_KEY_CAPACITY = 256
+
+
+def _shared_memory(name=None, create=False, size=0):
+    from multiprocessing.shared_memory import SharedMemory
+    if create:
+        return SharedMemory(name=name, create=True, size=size)
+    try:
+        # Python 3.13 and newer can be told not to let the resource tracker
+        # of an attaching process unlink the segment when it exits.
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        return SharedMemory(name=name)
+
+
+def _raw(native):
+    return b64decode(native.encode_base64())
+
+
+@attr.s
+class _Segment(object):
+    _shm = attr.ib()
+    _owner = attr.ib()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Detach from the segment and, if this object created it, remove it.
+        Other processes still attached keep their mapping.
+        """
+        self._release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _release(self):
+        pass
+
+
+@attr.s
+class SharedBatch(_Segment):
+    """
+    A read-only array of encoded objects of one wrapper type in shared
+    memory.
+
+    :ivar type type: The wrapper type of the records.
+    """
+    type = attr.ib()
+    _record_size = attr.ib()
+    _count = attr.ib()
+    _records = attr.ib()
+
+    @classmethod
+    def create(cls, natives, name=None):
+        """
+        Copy the encodings of some wrapper objects into a new segment.
+
+        :param list natives: Objects all of the same wrapper type.
+        :param str name: The name for the segment or ``None`` to pick one.
+
+        :return SharedBatch: The batch, which removes the segment when it is
+            closed.
+        """
+        natives = list(natives)
+        if not natives:
+            raise ValueError("SharedBatch requires at least one object")
+        native_type = type(natives[0])
+        if native_type not in _TYPES:
+            raise TypeError("cannot share {}".format(native_type.__name__))
+        records = list(map(_raw, natives))
+        record_size = len(records[0])
+        for (native, record) in zip(natives, records):
+            if type(native) is not native_type or len(record) != record_size:
+                raise ValueError("SharedBatch requires objects of one type and size")
+
+        shm = _shared_memory(
+            name=name,
+            create=True,
+            size=_BATCH_HEADER.size + record_size * len(records),
+        )
+        _BATCH_HEADER.pack_into(
+            shm.buf,
+            0,
+            _BATCH_MAGIC,
+            _VERSION,
+            _TYPES.index(native_type),
+            record_size,
+            len(records),
+        )
+        shm.buf[_BATCH_HEADER.size:_BATCH_HEADER.size + record_size * len(records)] = b"".join(records)
+        return cls._from_shm(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attach to a segment created by ``SharedBatch.create``, possibly in
+        another process.
+        """
+        return cls._from_shm(_shared_memory(name=name), owner=False)
+
+    @classmethod
+    def _from_shm(cls, shm, owner):
+        magic, version, type_index, record_size, count = _BATCH_HEADER.unpack_from(shm.buf, 0)
+        if magic != _BATCH_MAGIC or version != _VERSION or type_index >= len(_TYPES):
+            shm.close()
+            raise DecodeException("not a shared token batch")
+        records = shm.buf[_BATCH_HEADER.size:_BATCH_HEADER.size + record_size * count]
+        return cls(shm, owner, _TYPES[type_index], record_size, count, records)
+
+    def _release(self):
+        # The segment cannot be closed while views of it exist.
+        self._records.release()
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, index):
+        """
+        :return memoryview: The encoding of one record, without copying it.
+        """
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        offset = index * self._record_size
+        return self._records[offset:offset + self._record_size]
+
+    def __getitem__(self, index):
+        return self.type.decode_base64(b64encode(self.raw(index)))
+
+    def decode_all(self, start=0, stop=None):
+        """
+        Decode a range of the records.
+
+        :return list: The wrapper objects.
+        """
+        if stop is None:
+            stop = self._count
+        decode = self.type.decode_base64
+        return list(decode(b64encode(self.raw(n))) for n in range(start, stop))
+
+
+@attr.s
+class KeyGeneration(object):
+    """
+    The decoded keys of one generation of a ``SharedSigningKey``.
+
+    :ivar int generation: The generation the keys were read at.
+    :ivar SigningKey signing_key: The signing key.
+    :ivar PublicKey public_key: Its public key.
+    """
+    generation = attr.ib()
+    signing_key = attr.ib()
+    public_key = attr.ib()
+    _users = attr.ib(default=0)
+    _retired = attr.ib(default=False)
+
+    def _retire(self):
+        # Callers hold the lock of the owning SharedSigningKey.
+        self._retired = True
+        if self._users == 0:
+            self._destroy()
+
+    def _destroy(self):
+        self.signing_key.destroy()
+        self.public_key.destroy()
+
+
+@attr.s
+class SharedSigningKey(_Segment):
+    """
+    The current signing key of a group of processes, in shared memory.
+
+    One process creates it and calls ``rotate`` when the key changes.  The
+    others attach and use the key through ``current``, which only decodes it
+    again after a rotation.  ``current`` may be used by many threads at once.
+    """
+    _current = attr.ib(init=False, default=None)
+    _lock = attr.ib(init=False, default=attr.Factory(Lock))
+
+    @classmethod
+    def create(cls, signing_key, name=None):
+        shm = _shared_memory(
+            name=name,
+            create=True,
+            size=_KEY_HEADER.size + _KEY_CAPACITY,
+        )
+        _KEY_HEADER.pack_into(shm.buf, 0, _KEY_MAGIC, _VERSION, 0, 0)
+        shared = cls(shm, True)
+        shared.rotate(signing_key)
+        return shared
+
+    @classmethod
+    def attach(cls, name):
+        shm = _shared_memory(name=name)
+        magic, version, _, _ = _KEY_HEADER.unpack_from(shm.buf, 0)
+        if magic != _KEY_MAGIC or version != _VERSION:
+            shm.close()
+            raise DecodeException("not a shared signing key")
+        return cls(shm, False)
+
+    def rotate(self, signing_key):
+        """
+        Replace the shared key.  Only the creating process may do this.
+        """
+        if not self._owner:
+            raise ValueError("only the creator of a SharedSigningKey can rotate it")
+        raw = _raw(signing_key)
+        if len(raw) > _KEY_CAPACITY:
+            raise ValueError("signing key encoding is too large to share")
+        buf = self._shm.buf
+        _, _, generation, _ = _KEY_HEADER.unpack_from(buf, 0)
+        _KEY_HEADER.pack_into(buf, 0, _KEY_MAGIC, _VERSION, generation + 1, 0)
+        buf[_KEY_HEADER.size:_KEY_HEADER.size + len(raw)] = raw
+        _KEY_HEADER.pack_into(buf, 0, _KEY_MAGIC, _VERSION, generation + 2, len(raw))
+
+    def generation(self):
+        """
+        :return int: A number which changes each time the key is rotated.
+        """
+        return _KEY_HEADER.unpack_from(self._shm.buf, 0)[2]
+
+    def _read(self):
+        buf = self._shm.buf
+        while True:
+            _, _, before, length = _KEY_HEADER.unpack_from(buf, 0)
+            raw = bytes(buf[_KEY_HEADER.size:_KEY_HEADER.size + length])
+            _, _, after, _ = _KEY_HEADER.unpack_from(buf, 0)
+            if before == after and before % 2 == 0:
+                return before, raw
+
+    def _release(self):
+        with self._lock:
+            current, self._current = self._current, None
+            if current is not None:
+                current._retire()
+
+    @contextmanager
+    def current(self):
+        """
+        Use the current key for the duration of a ``with`` block::
+
+            with keyring.current() as keys:
+                signed = keys.signing_key.sign(blinded_token)
+
+        The key is decoded again only if it has been rotated since it was
+        last used.  The keys are not tracked by any ``Arena``.  They stay
+        valid until the block exits even if a rotation is noticed or this
+        object is closed meanwhile, and are destroyed once no block uses
+        them any more, so do not keep them past the block.
+
+        :return KeyGeneration: The keys, as the target of the ``with``.
+        """
+        with self._lock:
+            current = self._current
+            if current is None or current.generation != self.generation():
+                generation, raw = self._read()
+                with outside_arena():
+                    signing_key = SigningKey.decode_base64(b64encode(raw))
+                    public_key = PublicKey.from_signing_key(signing_key)
+                self._current = KeyGeneration(generation, signing_key, public_key)
+                if current is not None:
+                    current._retire()
+                current = self._current
+            current._users += 1
+        try:
+            yield current
+        finally:
+            with self._lock:
+                current._users -= 1
+                if current._retired and current._users == 0:
+                    current._destroy()
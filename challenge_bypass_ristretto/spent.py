@@ -0,0 +1,273 @@
+"""
+Tracking of spent tokens, partitioned by the key which issued them.
+
+A token can only be redeemed while the signing key which issued it is in
+use, so the record of which tokens have been spent only needs to live as
+long as that key.  ``SpentTokens`` keeps one partition per key (or per
+epoch, for services which name their keys that way) and drops a whole
+partition when its key retires.
+
+Nodes which share the job of redeeming tokens keep each other up to date
+by exchanging deltas.  A delta is a compressed, sorted batch of digests::
+
+    magic   4 bytes   b"CBRS"
+    version 1 byte    currently 1
+    size    1 byte    the length of each digest
+    count   4 bytes   big-endian number of digests
+
+followed by the zlib-compressed concatenation of the digests in ascending
+order.  Merging a delta only adds digests, so merging the same delta more
+than once or merging deltas in any order gives the same result.
+"""
+
+from base64 import (
+    b64decode,
+)
+from hashlib import (
+    blake2b,
+)
+from struct import (
+    Struct,
+)
+from threading import (
+    Lock,
+)
+from zlib import (
+    compress,
+    decompressobj,
+    error as ZlibError,
+)
+
+import attr
+
+from . import (
+    DecodeException,
+)
+
+DIGEST_SIZE = 16
+
+DELTA_MAGIC = b"CBRS"
+DELTA_VERSION = 1
+
+_DELTA_HEADER = Struct(">4sBBI")
+
+
+class UnknownEpochException(Exception):
+    """
+    Tokens were checked against an epoch which was never opened or which has
+    been retired.
+    """
+
+
+def preimage_digest(token_preimage):
+    """
+    Compute the compact identifier under which a spent token is recorded.
+
+    The digest is of the canonical encoding of the preimage, not of whatever
+    text a client sent, so differently encoded copies of the same preimage
+    get the same digest.
+
+    :param TokenPreimage token_preimage: The preimage of the token.
+
+    :return bytes: A ``DIGEST_SIZE`` byte digest.
+    """
+    return blake2b(
+        b64decode(token_preimage.encode_base64()),
+        digest_size=DIGEST_SIZE,
+    ).digest()
+
+
+def encode_delta(digests):
+    """
+    :param digests: An iterable of ``bytes`` digests.
+
+    :return bytes: The delta holding them.
+    """
+    digests = sorted(set(digests))
+    return _DELTA_HEADER.pack(
+        DELTA_MAGIC,
+        DELTA_VERSION,
+        DIGEST_SIZE,
+        len(digests),
+    ) + compress(b"".join(digests))
+
+
+def decode_delta(delta):
+    """
+    :param bytes delta: A delta made by ``encode_delta``.
+
+    :raise DecodeException: If ``delta`` is malformed.
+
+    :return list[bytes]: The digests in the delta.
+    """
+    if len(delta) < _DELTA_HEADER.size:
+        raise DecodeException("truncated spent token delta")
+    magic, version, size, count = _DELTA_HEADER.unpack_from(delta)
+    if magic != DELTA_MAGIC or version != DELTA_VERSION or size != DIGEST_SIZE:
+        raise DecodeException("not a spent token delta")
+    # Decompress at most one byte more than the header promises, so that a
+    # small delta cannot expand into an arbitrarily large amount of memory.
+    decompressor = decompressobj()
+    try:
+        joined = decompressor.decompress(
+            delta[_DELTA_HEADER.size:],
+            size * count + 1,
+        )
+    except ZlibError as e:
+        raise DecodeException("corrupt spent token delta", e)
+    if len(joined) != size * count:
+        raise DecodeException("spent token delta has the wrong length")
+    if not decompressor.eof:
+        raise DecodeException("truncated spent token delta")
+    return list(joined[n:n + size] for n in range(0, len(joined), size))
+
+
+@attr.s
+class SpentTokensStats(object):
+    """
+    :ivar dict sizes: A mapping from each open epoch to the number of tokens
+        recorded as spent in it.
+    :ivar int retired: The number of epochs retired so far.
+    """
+    sizes = attr.ib(default=attr.Factory(dict))
+    retired = attr.ib(default=0)
+
+
+@attr.s
+class _Partition(object):
+    # The digests spent in one epoch, as a set for lookups and in the order
+    # they were recorded for exporting deltas.
+    digests = attr.ib(default=attr.Factory(set))
+    log = attr.ib(default=attr.Factory(list))
+
+    def add(self, digests):
+        self.digests.update(digests)
+        self.log.extend(digests)
+
+
+@attr.s
+class SpentTokens(object):
+    """
+    Thread-safe sets of spent token digests, one per epoch.
+
+    For example::
+
+        spent = SpentTokens()
+        spent.open(key_id)
+        if any(spent.spend(key_id, token_preimages)):
+            ... reject the redemption ...
+        ...
+        spent.retire(old_key_id)
+    """
+    _epochs = attr.ib(init=False, default=attr.Factory(dict))
+    _retired = attr.ib(init=False, default=0)
+    _lock = attr.ib(init=False, default=attr.Factory(Lock))
+
+    def open(self, epoch):
+        """
+        Start recording spent tokens for an epoch.  Opening an epoch which is
+        already open does nothing.
+
+        :param epoch: Any hashable identifier for the epoch, such as a key
+            identifier.
+        """
+        with self._lock:
+            self._epochs.setdefault(epoch, _Partition())
+
+    def retire(self, epoch):
+        """
+        Forget every token spent in an epoch.  Tokens can no longer be spent
+        in it afterwards.
+        """
+        with self._lock:
+            if self._epochs.pop(epoch, None) is not None:
+                self._retired += 1
+
+    def epochs(self):
+        """
+        :return list: The open epochs.
+        """
+        with self._lock:
+            return list(self._epochs)
+
+    def _partition(self, epoch):
+        try:
+            return self._epochs[epoch]
+        except KeyError:
+            raise UnknownEpochException(epoch)
+
+    def spent(self, epoch, token_preimages):
+        """
+        Check tokens without spending them.
+
+        :return list[bool]: For each token, whether it has been spent.
+        """
+        digests = list(map(preimage_digest, token_preimages))
+        with self._lock:
+            partition = self._partition(epoch)
+            return list(digest in partition.digests for digest in digests)
+
+    def spend(self, epoch, token_preimages):
+        """
+        Record a batch of tokens as spent if none of them has been spent
+        already.  Either all of the tokens are recorded or none are.
+
+        :return list[bool]: For each token, whether it had already been
+            spent, either before this call or earlier in the same batch.  If
+            any is ``True``, nothing was recorded.
+        """
+        digests = list(map(preimage_digest, token_preimages))
+        with self._lock:
+            partition = self._partition(epoch)
+            seen = set()
+            double_spent = []
+            for digest in digests:
+                double_spent.append(digest in partition.digests or digest in seen)
+                seen.add(digest)
+            if not any(double_spent):
+                partition.add(digests)
+            return double_spent
+
+    def export_delta(self, epoch, since=0):
+        """
+        Make a delta of the tokens spent in an epoch.
+
+        :param int since: A position returned by an earlier call, to include
+            only tokens recorded after that call, or ``0`` for all of them.
+
+        :return: A two-tuple of the delta ``bytes`` and the position to pass
+            as ``since`` next time.
+        """
+        with self._lock:
+            partition = self._partition(epoch)
+            digests = partition.log[since:]
+            position = len(partition.log)
+        return encode_delta(digests), position
+
+    def merge_delta(self, epoch, delta):
+        """
+        Record every token in a delta as spent in an epoch.
+
+        :return int: The number of tokens which were not already recorded.
+        """
+        digests = decode_delta(delta)
+        with self._lock:
+            partition = self._partition(epoch)
+            new = list(
+                digest
+                for digest
+                in dict.fromkeys(digests)
+                if digest not in partition.digests
+            )
+            partition.add(new)
+            return len(new)
+
+    def stats(self):
+        """
+        :return SpentTokensStats: A snapshot of the sizes of the partitions.
+        """
+        with self._lock:
+            return SpentTokensStats(
+                sizes={epoch: len(partition.digests) for (epoch, partition) in self._epochs.items()},
+                retired=self._retired,
+            )
@@ -0,0 +1,115 @@
+"""
+Simple, thread-safe counters for the library's service-style helpers.
+"""
+
+from bisect import (
+    bisect_left,
+)
+from threading import (
+    Lock,
+)
+
+import attr
+
+
+def exponential_bounds(start, factor, count):
+    """
+    Compute bucket upper bounds which grow geometrically.
+
+    :param start: The first upper bound.
+    :param factor: The ratio between each bound and the one before it.
+    :param int count: The number of bounds.
+
+    :return: A ``tuple`` of ``count`` increasing bounds.
+    """
+    return tuple(start * factor ** n for n in range(count))
+
+
+@attr.s(frozen=True)
+class HistogramSnapshot(object):
+    """
+    The state of a ``Histogram`` at one point in time.
+
+    :ivar tuple bounds: The inclusive upper bound of each bucket except the
+        last, which has no upper bound.
+    :ivar tuple counts: The number of observations in each bucket.  This has
+        one more element than ``bounds``.
+    :ivar int count: The total number of observations.
+    :ivar total: The sum of all observations.
+    """
+    bounds = attr.ib()
+    counts = attr.ib()
+    count = attr.ib()
+    total = attr.ib()
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def quantile(self, q):
+        """
+        Estimate a quantile of the observations.
+
+        :param float q: The quantile to estimate, between 0 and 1.
+
+        :return: The upper bound of the bucket holding the quantile, the last
+            bound if it falls in the unbounded bucket, or ``None`` if there
+            are no observations.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+
+@attr.s
+class Histogram(object):
+    """
+    Count observations in buckets with fixed upper bounds.
+
+    :ivar tuple bounds: The increasing, inclusive upper bounds of the buckets.
+        Observations greater than the last bound are counted in an extra,
+        unbounded bucket.
+    """
+    bounds = attr.ib(converter=tuple)
+
+    _counts = attr.ib(init=False)
+    _count = attr.ib(init=False, default=0)
+    _total = attr.ib(init=False, default=0)
+    _lock = attr.ib(init=False, default=attr.Factory(Lock))
+
+    def __attrs_post_init__(self):
+        if not self.bounds or list(self.bounds) != sorted(set(self.bounds)):
+            raise ValueError("Histogram bounds must be non-empty and increasing")
+        self._counts = [0] * (len(self.bounds) + 1)
+
+    def record(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._total += value
+
+    def snapshot(self):
+        """
+        :return HistogramSnapshot: The current state of the histogram.
+        """
+        with self._lock:
+            return HistogramSnapshot(
+                bounds=self.bounds,
+                counts=tuple(self._counts),
+                count=self._count,
+                total=self._total,
+            )
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.bounds) + 1)
+            self._count = 0
+            self._total = 0
@@ -0,0 +1,188 @@
+import attr
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    Not,
+)
+
+from .. import (
+    Arena,
+    RandomToken,
+    PublicKey,
+    SignedToken,
+    BatchDLEQProof,
+    random_signing_key,
+)
+from ..cache import (
+    LRUCache,
+    IssuanceCache,
+    KeyCache,
+    issuance_digest,
+)
+
+
+@attr.s
+class FakeClock(object):
+    now = attr.ib(default=0)
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTests(TestCase):
+    """
+    Tests related to ``LRUCache``.
+    """
+    def test_eviction(self):
+        """
+        ``LRUCache`` evicts the least recently used entry when it is full.
+        """
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.expectThat(cache.get("a"), Equals(1))
+        cache.put("c", 3)
+        self.expectThat(
+            (cache.get("a"), cache.get("b"), cache.get("c")),
+            Equals((1, None, 3)),
+        )
+        stats = cache.stats()
+        self.expectThat(
+            (stats.size, stats.hits, stats.misses, stats.evictions),
+            Equals((2, 3, 1, 1)),
+        )
+
+    def test_ttl(self):
+        """
+        ``LRUCache`` drops entries once they are older than its time-to-live.
+        """
+        clock = FakeClock()
+        cache = LRUCache(maxsize=2, ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 9
+        self.expectThat(cache.get("a"), Equals(1))
+        clock.now = 10
+        self.expectThat(cache.get("a"), Equals(None))
+        self.expectThat(cache.stats().expirations, Equals(1))
+
+    def test_invalidate(self):
+        """
+        ``LRUCache.invalidate`` drops an entry.
+        """
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.invalidate("a")
+        cache.invalidate("b")
+        self.assertThat(cache.get("a"), Equals(None))
+
+
+class IssuanceDigestTests(TestCase):
+    """
+    Tests related to ``issuance_digest``.
+    """
+    def test_long_item(self):
+        """
+        ``issuance_digest`` accepts items longer than 65535 bytes and
+        distinguishes where one item ends and the next begins.
+        """
+        long_item = b"a" * 70000
+        self.expectThat(
+            issuance_digest(b"key", [long_item]),
+            Not(Equals(issuance_digest(b"key", [long_item[:-1], b"a"]))),
+        )
+
+
+class IssuanceCacheTests(TestCase):
+    """
+    Tests related to ``IssuanceCache``.
+    """
+    def test_retry(self):
+        """
+        ``IssuanceCache.issue`` returns the same valid response for a repeated
+        request without computing it again.
+        """
+        signing_key = random_signing_key()
+        _, blinded_tokens = RandomToken.create_and_blind_many(3)
+        marshaled = list(t.encode_base64() for t in blinded_tokens)
+        key_id = PublicKey.from_signing_key(signing_key).encode_base64()
+        cache = IssuanceCache()
+        first = cache.issue(signing_key, key_id, marshaled)
+        second = cache.issue(signing_key, key_id, marshaled)
+        self.expectThat(second, Equals(first))
+        stats = cache.stats()
+        self.expectThat((stats.hits, stats.misses), Equals((1, 1)))
+
+        marshaled_signed_tokens, marshaled_proof = second
+        self.expectThat(
+            BatchDLEQProof.decode_base64(marshaled_proof).invalid(
+                blinded_tokens,
+                list(map(SignedToken.decode_base64, marshaled_signed_tokens)),
+                PublicKey.from_signing_key(signing_key),
+            ),
+            Equals(False),
+        )
+
+    def test_different_key(self):
+        """
+        ``IssuanceCache.issue`` does not reuse a response made with a different
+        signing key.
+        """
+        _, blinded_tokens = RandomToken.create_and_blind_many(1)
+        marshaled = list(t.encode_base64() for t in blinded_tokens)
+        cache = IssuanceCache()
+        first = cache.issue(random_signing_key(), b"first", marshaled)
+        second = cache.issue(random_signing_key(), b"second", marshaled)
+        self.expectThat(second, Not(Equals(first)))
+        self.expectThat(cache.stats().misses, Equals(2))
+
+
+class KeyCacheTests(TestCase):
+    """
+    Tests related to ``KeyCache``.
+    """
+    def test_signing_key(self):
+        """
+        ``KeyCache.signing_key`` decodes a signing key once and returns the same
+        key and public key after that.
+        """
+        signing_key = random_signing_key()
+        encoded = signing_key.encode_base64()
+        cache = KeyCache()
+        decoded, public_key = cache.signing_key(encoded)
+        self.expectThat(decoded.encode_base64(), Equals(encoded))
+        self.expectThat(
+            public_key.encode_base64(),
+            Equals(PublicKey.from_signing_key(signing_key).encode_base64()),
+        )
+        self.expectThat(cache.signing_key(encoded), Equals((decoded, public_key)))
+        stats = cache.stats()
+        self.expectThat((stats.hits, stats.misses), Equals((1, 1)))
+
+    def test_invalidate(self):
+        """
+        ``KeyCache.invalidate`` makes the next lookup of a key decode it again.
+        """
+        encoded = PublicKey.from_signing_key(random_signing_key()).encode_base64()
+        cache = KeyCache()
+        first = cache.public_key(encoded)
+        cache.invalidate(encoded)
+        second = cache.public_key(encoded)
+        self.expectThat(second.encode_base64(), Equals(encoded))
+        self.expectThat(cache.stats().misses, Equals(2))
+        self.expectThat(second is first, Equals(False))
+
+    def test_arena(self):
+        """
+        A key first decoded inside an ``Arena`` stays usable after the arena
+        exits.
+        """
+        encoded = random_signing_key().encode_base64()
+        cache = KeyCache()
+        with Arena():
+            cache.signing_key(encoded)
+        signing_key, public_key = cache.signing_key(encoded)
+        self.expectThat(signing_key.encode_base64(), Equals(encoded))
+        self.expectThat(public_key.encode_base64(), Not(Equals(None)))
@@ -0,0 +1,208 @@
+from io import (
+    BytesIO,
+)
+from json import (
+    dumps,
+    loads,
+)
+from os.path import (
+    join,
+)
+from tempfile import (
+    mkdtemp,
+)
+from shutil import (
+    rmtree,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    HasLength,
+)
+
+from .. import (
+    RandomToken,
+    SigningKey,
+)
+from ..cli import (
+    main,
+    process,
+)
+from ..wire import (
+    read_issue_response,
+    read_raw_containers,
+    write_issue_request,
+    write_redemption,
+)
+from .util import (
+    encoded_text,
+    make_passes,
+)
+
+
+class CommandLineTests(TestCase):
+    """
+    Tests related to ``python -m challenge_bypass_ristretto``.
+    """
+    def setUp(self):
+        super(CommandLineTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+        self.key_path = self.path("key.json")
+        self.assertThat(main(["keygen", "-o", self.key_path]), Equals(0))
+
+    def path(self, name):
+        return join(self.directory, name)
+
+    def write_lines(self, name, records):
+        with open(self.path(name), "wb") as f:
+            for record in records:
+                f.write(dumps(record).encode("utf-8") + b"\n")
+        return self.path(name)
+
+    def read_lines(self, name):
+        with open(self.path(name), "rb") as f:
+            return list(map(loads, f.read().splitlines()))
+
+    def _pipeline(self, jobs):
+        requests = list(
+            dict(tokens=encoded_text(tokens), blinded_tokens=encoded_text(blinded_tokens))
+            for (tokens, blinded_tokens)
+            in (RandomToken.create_and_blind_many(n) for n in range(1, 6))
+        )
+        jobs = ["--jobs", str(jobs)]
+        self.write_lines("requests", requests)
+        self.expectThat(
+            main(["issue", "--signing-key", self.key_path, "-i", self.path("requests"), "-o", self.path("issued")] + jobs),
+            Equals(0),
+        )
+        self.write_lines("unblind", list(
+            dict(request, **response)
+            for (request, response)
+            in zip(requests, self.read_lines("issued"))
+        ))
+        self.expectThat(
+            main(["unblind", "--public-key", self.key_path, "-i", self.path("unblind"), "-o", self.path("unblinded")] + jobs),
+            Equals(0),
+        )
+        self.expectThat(
+            main(["redeem", "--message", "hello", "-i", self.path("unblinded"), "-o", self.path("passes")] + jobs),
+            Equals(0),
+        )
+        self.expectThat(
+            main(["verify", "--message", "hello", "--signing-key", self.key_path, "-i", self.path("passes"), "-o", self.path("verified")] + jobs),
+            Equals(0),
+        )
+        self.expectThat(
+            self.read_lines("verified"),
+            Equals(list({"invalid": [False] * n} for n in range(1, 6))),
+        )
+        self.expectThat(
+            main(["verify", "--message", "goodbye", "--signing-key", self.key_path, "-i", self.path("passes"), "-o", self.path("verified")] + jobs),
+            Equals(0),
+        )
+        self.expectThat(
+            self.read_lines("verified"),
+            Equals(list({"invalid": [True] * n} for n in range(1, 6))),
+        )
+
+    def test_pipeline(self):
+        """
+        The output of each subcommand can be fed to the next to issue, unblind,
+        redeem, and verify tokens.
+        """
+        self._pipeline(jobs=1)
+
+    def test_pipeline_parallel(self):
+        """
+        The subcommands give the same results in order when run with more
+        than one job.
+        """
+        self._pipeline(jobs=2)
+
+    def test_errors(self):
+        """
+        A request which cannot be processed produces an error record in its
+        place and an exit status of 1.
+        """
+        _, blinded_tokens = RandomToken.create_and_blind_many(1)
+        self.write_lines("requests", [
+            {"blinded_tokens": ["not valid base64"]},
+            {"blinded_tokens": encoded_text(blinded_tokens)},
+        ])
+        self.expectThat(
+            main(["issue", "--signing-key", self.key_path, "-i", self.path("requests"), "-o", self.path("issued")]),
+            Equals(1),
+        )
+        [bad, good] = self.read_lines("issued")
+        self.expectThat(sorted(bad), Equals(["error"]))
+        self.expectThat(good["signed_tokens"], HasLength(1))
+
+    def test_binary(self):
+        """
+        ``issue`` and ``verify`` read and write binary containers with
+        ``--format binary``.
+        """
+        with open(self.path("requests"), "wb") as f:
+            for n in range(3):
+                write_issue_request(f, RandomToken.create_and_blind_many(n)[1])
+        self.expectThat(
+            main(["issue", "--format", "binary", "--signing-key", self.key_path, "-i", self.path("requests"), "-o", self.path("issued")]),
+            Equals(0),
+        )
+        with open(self.path("issued"), "rb") as f:
+            responses = list(read_issue_response(f) for _ in range(3))
+        self.expectThat(
+            list(len(signed_tokens) for (signed_tokens, proof) in responses),
+            Equals([0, 1, 2]),
+        )
+
+        with open(self.key_path, "rb") as f:
+            signing_key = SigningKey.decode_base64(loads(f.read())["signing_key"].encode("ascii"))
+        with open(self.path("passes"), "wb") as f:
+            write_redemption(f, make_passes(signing_key, b"hello", 2))
+        self.expectThat(
+            main(["verify", "--format", "binary", "--message", "hello", "--signing-key", self.key_path, "-i", self.path("passes"), "-o", self.path("verified")]),
+            Equals(0),
+        )
+        self.expectThat(self.read_lines("verified"), Equals([{"invalid": [False, False]}]))
+
+    def test_binary_errors(self):
+        """
+        ``issue --format binary`` leaves out the response to a request which
+        cannot be processed, reports it with its position on the error stream
+        and exits with status 1.
+        """
+        with open(self.path("requests"), "wb") as f:
+            write_issue_request(f, RandomToken.create_and_blind_many(1)[1])
+            write_redemption(f, [])
+            write_issue_request(f, RandomToken.create_and_blind_many(2)[1])
+        self.expectThat(
+            main(["issue", "--format", "binary", "--signing-key", self.key_path, "-i", self.path("requests"), "-o", self.path("issued"), "--jobs", "2"]),
+            Equals(1),
+        )
+        with open(self.path("issued"), "rb") as f:
+            responses = list(read_issue_response(f) for _ in range(2))
+            self.expectThat(f.read(), Equals(b""))
+        self.expectThat(
+            list(len(signed_tokens) for (signed_tokens, proof) in responses),
+            Equals([1, 2]),
+        )
+
+        with open(self.key_path, "rb") as f:
+            encoded_signing_key = loads(f.read())["signing_key"].encode("ascii")
+        errors = BytesIO()
+        with open(self.path("requests"), "rb") as f:
+            process(
+                "issue-binary",
+                read_raw_containers(f),
+                BytesIO(),
+                initargs=(encoded_signing_key, None, None),
+                errors=errors,
+            )
+        [error] = list(map(loads, errors.getvalue().splitlines()))
+        self.expectThat(sorted(error), Equals(["error", "request"]))
+        self.expectThat(error["request"], Equals(1))
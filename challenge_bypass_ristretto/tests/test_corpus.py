@@ -0,0 +1,198 @@
+from io import (
+    BytesIO,
+)
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    raises,
+)
+
+from .. import (
+    BatchDLEQProof,
+    DecodeException,
+    PublicKey,
+    Token,
+    VerificationKey,
+)
+from ..corpus import (
+    generate,
+    read,
+    write,
+)
+from .util import (
+    encoded,
+    sample_corpus,
+)
+
+
+def encoded_passes(passes):
+    return list(
+        (token_preimage.encode_base64(), signature.encode_base64())
+        for (token_preimage, signature)
+        in passes
+    )
+
+
+def encoded_key_set(key_set):
+    return (
+        key_set.signing_key.encode_base64(),
+        encoded(key_set.tokens),
+        encoded(key_set.blinded_tokens),
+        encoded(key_set.signed_tokens),
+        encoded(key_set.unblinded_tokens),
+        encoded_passes(key_set.passes),
+    )
+
+
+class CorpusFileTests(TestCase):
+    """
+    Tests related to ``write`` and ``read``.
+    """
+    def test_roundtrip(self):
+        """
+        A corpus read back from what ``write`` wrote has the same objects.
+        """
+        corpus = sample_corpus()
+        stream = BytesIO()
+        write(stream, corpus)
+        stream.seek(0)
+        copy = read(stream)
+        self.expectThat(copy.message, Equals(corpus.message))
+        self.expectThat(
+            list(map(encoded_key_set, copy.key_sets)),
+            Equals(list(map(encoded_key_set, corpus.key_sets))),
+        )
+        self.expectThat(
+            list(k.proof.encode_base64() for k in copy.key_sets),
+            Equals(list(k.proof.encode_base64() for k in corpus.key_sets)),
+        )
+
+    def test_not_a_corpus(self):
+        """
+        ``read`` raises ``DecodeException`` for something which is not a
+        corpus.
+        """
+        self.assertThat(
+            lambda: read(BytesIO(b"CBRW\x01\x01\x00\x00\x00\x00")),
+            raises(DecodeException),
+        )
+
+    def test_reproducible(self):
+        """
+        ``generate`` with the same seed makes the same keys, tokens,
+        signatures and passes.
+        """
+        a = generate(seed=b"x", key_count=1, token_count=3)
+        b = generate(seed=b"x", key_count=1, token_count=3)
+        self.assertThat(
+            list(map(encoded_key_set, a.key_sets)),
+            Equals(list(map(encoded_key_set, b.key_sets))),
+        )
+
+
+class BatchPathTests(TestCase):
+    """
+    The batch and the one-at-a-time APIs make the same objects, byte for
+    byte, as those in a corpus.
+    """
+    def test_blind(self):
+        """
+        ``Token.blind_many`` and ``Token.blind`` make the corpus blinded tokens.
+        """
+        for key_set in sample_corpus().key_sets:
+            expected = encoded(key_set.blinded_tokens)
+            self.expectThat(encoded(Token.blind_many(key_set.tokens)), Equals(expected))
+            self.expectThat(encoded(t.blind() for t in key_set.tokens), Equals(expected))
+
+    def test_proof(self):
+        """
+        The corpus proofs, and new proofs for the same tokens, are valid.
+        """
+        for key_set in sample_corpus().key_sets:
+            public_key = PublicKey.from_signing_key(key_set.signing_key)
+            self.expectThat(
+                key_set.proof.invalid(
+                    key_set.blinded_tokens,
+                    key_set.signed_tokens,
+                    public_key,
+                ),
+                Equals(False),
+            )
+            self.expectThat(
+                BatchDLEQProof.create(
+                    key_set.signing_key,
+                    key_set.blinded_tokens,
+                    key_set.signed_tokens,
+                ).invalid(
+                    key_set.blinded_tokens,
+                    key_set.signed_tokens,
+                    public_key,
+                ),
+                Equals(False),
+            )
+
+    def test_unblind(self):
+        """
+        ``BatchDLEQProof.invalid_or_unblind``, ``Token.unblind_many`` and
+        ``Token.unblind`` make the corpus unblinded tokens.
+        """
+        for key_set in sample_corpus().key_sets:
+            expected = encoded(key_set.unblinded_tokens)
+            self.expectThat(
+                encoded(key_set.proof.invalid_or_unblind(
+                    key_set.tokens,
+                    key_set.blinded_tokens,
+                    key_set.signed_tokens,
+                    PublicKey.from_signing_key(key_set.signing_key),
+                )),
+                Equals(expected),
+            )
+            self.expectThat(
+                encoded(Token.unblind_many(key_set.tokens, key_set.signed_tokens)),
+                Equals(expected),
+            )
+            self.expectThat(
+                encoded(
+                    token.unblind(signed_token)
+                    for (token, signed_token)
+                    in zip(key_set.tokens, key_set.signed_tokens)
+                ),
+                Equals(expected),
+            )
+
+    def test_passes(self):
+        """
+        The corpus passes are remade exactly and verify one at a time and in
+        a batch.
+        """
+        message = sample_corpus().message
+        for key_set in sample_corpus().key_sets:
+            self.expectThat(
+                encoded_passes(
+                    (t.preimage(), t.derive_verification_key_sha512().sign_sha512(message))
+                    for t
+                    in key_set.unblinded_tokens
+                ),
+                Equals(encoded_passes(key_set.passes)),
+            )
+            keys = list(
+                key_set.signing_key.rederive_unblinded_token(
+                    token_preimage,
+                ).derive_verification_key_sha512()
+                for (token_preimage, _) in key_set.passes
+            )
+            signatures = list(signature for (_, signature) in key_set.passes)
+            self.expectThat(
+                list(
+                    key.invalid_sha512(signature, message)
+                    for (key, signature)
+                    in zip(keys, signatures)
+                ),
+                Equals([False] * len(keys)),
+            )
+            self.expectThat(
+                VerificationKey.invalid_sha512_many(keys, signatures, message),
+                Equals(0),
+            )
@@ -0,0 +1,83 @@
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Contains,
+    Equals,
+)
+
+from .. import (
+    Arena,
+    RandomToken,
+)
+from .. import diagnostics
+
+
+class DiagnosticsTests(TestCase):
+    """
+    Tests related to ``challenge_bypass_ristretto.diagnostics``.
+    """
+    def setUp(self):
+        super(DiagnosticsTests, self).setUp()
+        self.addCleanup(diagnostics.disable)
+
+    def test_counts(self):
+        """
+        ``diagnostics.snapshot`` reports the live count, high water mark, and
+        estimated size of each type of native object.
+        """
+        before = RandomToken.create()
+        diagnostics.enable()
+        with Arena():
+            RandomToken.create_and_blind_many(3)
+        tokens = RandomToken.create_many(2)
+        before.destroy()
+        usage = diagnostics.snapshot()
+        self.expectThat(
+            (
+                usage["Token"].live,
+                usage["Token"].high_water,
+                usage["Token"].allocated,
+                usage["Token"].destroyed,
+                usage["Token"].estimated_bytes,
+            ),
+            Equals((2, 3, 5, 3, 2 * diagnostics.NATIVE_SIZES["Token"])),
+        )
+        self.expectThat(
+            (usage["BlindedToken"].live, usage["BlindedToken"].high_water),
+            Equals((0, 3)),
+        )
+        self.expectThat(
+            diagnostics.total_estimated_bytes(),
+            Equals(2 * diagnostics.NATIVE_SIZES["Token"]),
+        )
+        diagnostics.reset_high_water()
+        self.expectThat(diagnostics.snapshot()["Token"].high_water, Equals(2))
+
+    def test_sites(self):
+        """
+        ``diagnostics.top_sites`` reports where the live objects were
+        allocated.
+        """
+        diagnostics.enable(track_sites=True)
+
+        def allocate_some():
+            return RandomToken.create_many(3)
+
+        tokens = allocate_some()
+        RandomToken.create()
+        [site, other] = diagnostics.top_sites()
+        self.expectThat(site.count, Equals(3))
+        self.expectThat(
+            list(name for (filename, lineno, name) in site.traceback),
+            Contains("allocate_some"),
+        )
+        self.expectThat(other.count, Equals(1))
+
+    def test_disabled(self):
+        """
+        ``diagnostics.snapshot`` raises ``ValueError`` if diagnostics are not
+        enabled.
+        """
+        self.expectThat(diagnostics.is_enabled(), Equals(False))
+        self.assertRaises(ValueError, diagnostics.snapshot)
@@ -0,0 +1,107 @@
+from time import (
+    sleep,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    HasLength,
+    raises,
+)
+
+from .. import (
+    Arena,
+)
+from ..pool import (
+    TokenPool,
+)
+
+
+def _encoded_pairs(pairs):
+    return list(
+        (token.blind().encode_base64(), blinded_token.encode_base64())
+        for (token, blinded_token)
+        in pairs
+    )
+
+
+class TokenPoolTests(TestCase):
+    """
+    Tests related to ``TokenPool``.
+    """
+    def test_rejects_bad_marks(self):
+        """
+        ``TokenPool`` raises ``ValueError`` if the low water mark is not below
+        the high water mark.
+        """
+        self.assertThat(
+            lambda: TokenPool(high_water=4, low_water=4),
+            raises(ValueError),
+        )
+
+    def test_take_from_empty_pool(self):
+        """
+        ``TokenPool.take`` generates pairs on demand if the pool is empty and
+        counts them as misses.
+        """
+        pool = TokenPool(high_water=4, low_water=1)
+        pairs = pool.take(3)
+        self.expectThat(pairs, HasLength(3))
+        self.expectThat(
+            list(a for (a, b) in _encoded_pairs(pairs)),
+            Equals(list(b for (a, b) in _encoded_pairs(pairs))),
+        )
+        stats = pool.stats()
+        self.expectThat((stats.hits, stats.misses), Equals((0, 3)))
+
+    def test_take_from_filled_pool(self):
+        """
+        ``TokenPool.take`` hands out pairs generated by ``TokenPool.fill`` and
+        only generates the shortfall.
+        """
+        pool = TokenPool(high_water=4, low_water=1)
+        pool.fill()
+        self.expectThat(len(pool), Equals(4))
+        pairs = pool.take(6)
+        self.expectThat(pairs, HasLength(6))
+        stats = pool.stats()
+        self.expectThat(
+            (stats.available, stats.hits, stats.misses, stats.generated),
+            Equals((0, 4, 2, 4)),
+        )
+
+    def test_fill_inside_arena(self):
+        """
+        Pairs added by ``TokenPool.fill`` inside an ``Arena`` are still usable
+        after the arena exits.
+        """
+        pool = TokenPool(high_water=2, low_water=1)
+        with Arena():
+            pool.fill()
+        pairs = pool.take(2)
+        self.expectThat(
+            list(a for (a, b) in _encoded_pairs(pairs)),
+            Equals(list(b for (a, b) in _encoded_pairs(pairs))),
+        )
+
+    def test_background_refill(self):
+        """
+        Once started, ``TokenPool`` generates pairs in the background up to its
+        high water mark and refills after dropping to its low water mark.
+        """
+        pool = TokenPool(high_water=8, low_water=2, batch_size=3)
+
+        def wait_for_full():
+            for _ in range(500):
+                if len(pool) == 8:
+                    break
+                sleep(0.01)
+            self.expectThat(len(pool), Equals(8))
+
+        with pool:
+            wait_for_full()
+            pool.take(6)
+            wait_for_full()
+            self.expectThat(pool.stats().generated, Equals(14))
@@ -1,6 +1,9 @@
 from base64 import (
     b64encode,
 )
+from threading import (
+    Thread,
+)
 from testtools import (
     TestCase,
 )
@@ -19,39 +22,53 @@ from hypothesis import (
     note,
 )
 from hypothesis.strategies import (
+    booleans,
     builds,
     lists,
     binary,
+    integers,
     text,
 )
 
 from .. import (
     ffi,
+    lib,
+    Arena,
+    current_arena,
+    outside_arena,
     DecodeException,
     RandomToken,
     BlindedToken,
     SignedToken,
     PublicKey,
     BatchDLEQProof,
+    BatchDLEQProofBuilder,
     random_signing_key,
+    VerificationKey,
     VerificationSignature,
     KeyException,
     SecurityException,
+    seeded_random_bytes,
+    _call_with_raising,
+    _discard_last_error,
 )
 
-def random_tokens():
+def seeds():
+    """
+    Strategy that builds seeds for ``seeded_random_bytes``, so that every
+    object made from one is reproduced exactly when Hypothesis replays an
+    example.
     """
-    Strategy that builds ``RandomToken`` instances.
+    return binary(min_size=1)
 
-    Note these tokens really are random because we have no facility to control
-    the source of randomness.  This is of questionable validity in combination
-    with Hypothesis.
 
-    We could probably fiddle around with deserialization from base64 to get
-    repeatability.
+def random_tokens(seeds=seeds()):
     """
-    return builds(
-        RandomToken.create,
+    Strategy that builds ``RandomToken`` instances from seeds drawn from
+    ``seeds``.
+    """
+    return seeds.map(
+        lambda seed: RandomToken.create_many(1, seeded_random_bytes(seed))[0],
     )
 
 
@@ -63,19 +80,13 @@ def blinded_tokens(random_tokens=random_tokens()):
     return random_tokens.map(lambda random_token: random_token.blind())
 
 
-def signing_keys():
+def signing_keys(seeds=seeds()):
     """
-    Strategy that builds random ``SigningKey`` instances.
-
-    Note these keys really are random because we have no facility to control
-    the source of randomness.  This is of questionable validity in combination
-    with Hypothesis.
-
-    We could probably fiddle around with deserialization from base64 to get
-    repeatability.
+    Strategy that builds ``SigningKey`` instances from seeds drawn from
+    ``seeds``.
     """
-    return builds(
-        random_signing_key,
+    return seeds.map(
+        lambda seed: random_signing_key(seeded_random_bytes(seed)),
     )
 
 
@@ -113,6 +124,221 @@ class RoundTripsThroughBase64(object):
         return None
 
 
+class ArenaTests(TestCase):
+    """
+    Tests related to ``Arena``.
+    """
+    def test_destroys_objects(self):
+        """
+        ``Arena`` destroys the native objects wrapped while it is active, except
+        those passed to ``Arena.keep``, and leaves others alone.
+        """
+        outside = RandomToken.create()
+        with Arena() as arena:
+            self.expectThat(current_arena(), Equals(arena))
+            tokens, blinded_tokens = RandomToken.create_and_blind_many(3)
+            kept = arena.keep(blinded_tokens[0])
+            self.expectThat(len(arena), Equals(5))
+        self.expectThat(current_arena(), Equals(None))
+        self.expectThat(
+            list(t._raw for t in tokens + blinded_tokens[1:]),
+            Equals([None] * 5),
+        )
+        self.expectThat(kept, RoundTripsThroughBase64())
+        self.expectThat(outside, RoundTripsThroughBase64())
+
+    def test_already_destroyed(self):
+        """
+        ``Arena`` does not destroy an object again if it was already destroyed
+        explicitly.
+        """
+        signing_key = random_signing_key()
+        with Arena():
+            blinded_tokens = RandomToken.blind_many(RandomToken.create_many(2))
+            signed_tokens = list(map(signing_key.sign, blinded_tokens))
+            proof = BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens)
+            proof.destroy()
+        self.assertThat(proof._raw, Equals(None))
+
+    def test_nested(self):
+        """
+        Objects are collected by the innermost active ``Arena``.
+        """
+        with Arena() as outer:
+            a = RandomToken.create()
+            with Arena() as inner:
+                b = RandomToken.create()
+                self.expectThat((len(outer), len(inner)), Equals((1, 1)))
+            self.expectThat(b._raw, Equals(None))
+            self.expectThat(a, RoundTripsThroughBase64())
+        self.expectThat(a._raw, Equals(None))
+
+    def test_outside(self):
+        """
+        Objects created inside ``outside_arena`` are not collected by any
+        active ``Arena``, and the arenas resume collecting afterwards.
+        """
+        with Arena() as outer:
+            with Arena() as inner:
+                with outside_arena():
+                    self.expectThat(current_arena(), Equals(None))
+                    kept = RandomToken.create()
+                self.expectThat(current_arena(), Equals(inner))
+                released = RandomToken.create()
+                self.expectThat((len(outer), len(inner)), Equals((0, 1)))
+        self.expectThat(released._raw, Equals(None))
+        self.expectThat(kept, RoundTripsThroughBase64())
+
+
+class NativeSymbolTests(TestCase):
+    """
+    Tests for the native functions the bindings depend on.
+    """
+    def test_present(self):
+        """
+        The native library exports every function used for proof verification,
+        deferred unblinding and releasing native objects.  Most of these are
+        only looked up when they are called, so check for them here instead of
+        waiting for the first caller to fail.
+        """
+        required = [
+            "token_unblind",
+            "batch_dleq_proof_invalid",
+            "batch_dleq_proof_invalid_or_unblind",
+            "token_destroy",
+            "blinded_token_destroy",
+            "signed_token_destroy",
+            "unblinded_token_destroy",
+            "token_preimage_destroy",
+            "verification_key_destroy",
+            "verification_signature_destroy",
+            "signing_key_destroy",
+            "public_key_destroy",
+            "batch_dleq_proof_destroy",
+        ]
+        self.assertThat(
+            list(name for name in required if not hasattr(lib, name)),
+            Equals([]),
+        )
+
+
+class ErrorReportingTests(TestCase):
+    """
+    Tests related to how failures of native calls are reported.
+    """
+    def test_no_native_message(self):
+        """
+        ``_call_with_raising`` raises the given exception type with a message
+        naming the function if the native library has no error message for
+        the calling thread.
+        """
+        _discard_last_error()
+
+        def failing():
+            return ffi.NULL
+        self.assertThat(
+            lambda: _call_with_raising(ffi.NULL, KeyException, failing),
+            raises(KeyException),
+        )
+        try:
+            _call_with_raising(ffi.NULL, KeyException, failing)
+        except KeyException as e:
+            self.assertThat(e.args, Equals((b"failing failed",)))
+
+    def test_concurrent_failures(self):
+        """
+        Many threads mixing successful and failing native calls each see
+        exactly the outcomes of their own calls, and each failure is reported
+        with the message the same call gets when made alone.
+        """
+        signing_key = random_signing_key()
+        public_key = PublicKey.from_signing_key(signing_key)
+        other_public_key = PublicKey.from_signing_key(random_signing_key())
+        message = b"message"
+        outcomes = {}
+
+        def bad_encoding(n, i):
+            return b"not valid base64 %d %d" % (n, i)
+
+        def failure(f, *a):
+            try:
+                f(*a)
+            except Exception as e:
+                return e.args
+            return None
+
+        def unblind_with_wrong_key():
+            tokens, blinded_tokens = RandomToken.create_and_blind_many(2)
+            signed_tokens = list(map(signing_key.sign, blinded_tokens))
+            BatchDLEQProof.create(
+                signing_key, blinded_tokens, signed_tokens,
+            ).invalid_or_unblind(
+                tokens, blinded_tokens, signed_tokens, other_public_key,
+            )
+
+        # What each failing call reports when nothing else is going on.
+        _discard_last_error()
+        alone = {
+            (n, i): failure(BlindedToken.decode_base64, bad_encoding(n, i))
+            for n in range(16)
+            for i in range(50)
+        }
+        alone["unblind"] = failure(unblind_with_wrong_key)
+
+        def exercise(n):
+            results = []
+            for i in range(50):
+                if (n + i) % 3 == 0:
+                    try:
+                        BlindedToken.decode_base64(bad_encoding(n, i))
+                    except DecodeException as e:
+                        results.append(("decode", e.args == alone[n, i]))
+                    else:
+                        results.append(("decode", None))
+                    continue
+
+                tokens, blinded_tokens = RandomToken.create_and_blind_many(2)
+                signed_tokens = list(map(signing_key.sign, blinded_tokens))
+                proof = BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens)
+                key = public_key if (n + i) % 3 == 1 else other_public_key
+                try:
+                    unblinded_tokens = proof.invalid_or_unblind(
+                        tokens, blinded_tokens, signed_tokens, key,
+                    )
+                except SecurityException as e:
+                    results.append((
+                        "unblind",
+                        key is other_public_key and e.args == alone["unblind"],
+                    ))
+                    continue
+                verification_key = unblinded_tokens[0].derive_verification_key_sha512()
+                results.append((
+                    "verify",
+                    key is public_key and not verification_key.invalid_sha512(
+                        verification_key.sign_sha512(message),
+                        message,
+                    ),
+                ))
+            outcomes[n] = results
+
+        threads = list(Thread(target=exercise, args=(n,)) for n in range(16))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertThat(
+            outcomes,
+            Equals(dict(
+                (n, list(
+                    (["decode", "verify", "unblind"][(n + i) % 3], True)
+                    for i in range(50)
+                ))
+                for n in range(16)
+            )),
+        )
+
+
 class RandomTokenTests(TestCase):
     """
     Tests related to ``RandomToken``.
@@ -121,6 +347,69 @@ class RandomTokenTests(TestCase):
     def test_serialization_roundtrip(self, random_token):
         self.assertThat(random_token, RoundTripsThroughBase64())
 
+    @given(integers(min_value=0, max_value=16))
+    def test_create_many(self, count):
+        """
+        ``RandomToken.create_many`` returns the requested number of distinct
+        tokens.
+        """
+        tokens = RandomToken.create_many(count)
+        self.assertThat(
+            len(set(token.encode_base64() for token in tokens)),
+            Equals(count),
+        )
+
+    @given(binary(min_size=1), integers(min_value=0, max_value=16))
+    def test_create_many_seeded(self, seed, count):
+        """
+        ``RandomToken.create_many`` returns the same tokens each time it is
+        called with randomness from ``seeded_random_bytes`` with the same
+        seed.
+        """
+        def encoded_tokens():
+            return list(
+                token.encode_base64()
+                for token
+                in RandomToken.create_many(count, seeded_random_bytes(seed))
+            )
+        first = encoded_tokens()
+        self.expectThat(len(set(first)), Equals(count))
+        self.expectThat(encoded_tokens(), Equals(first))
+
+    @given(lists(random_tokens()))
+    def test_blind_many(self, tokens):
+        """
+        ``RandomToken.blind_many`` returns the same blinded tokens as
+        ``RandomToken.blind`` called on each token.
+        """
+        self.assertThat(
+            list(t.encode_base64() for t in RandomToken.blind_many(tokens)),
+            Equals(list(t.blind().encode_base64() for t in tokens)),
+        )
+
+    @given(binary(min_size=1), integers(min_value=0, max_value=16))
+    def test_create_and_blind_many(self, seed, count):
+        """
+        ``RandomToken.create_and_blind_many`` returns the tokens
+        ``RandomToken.create_many`` creates and those tokens blinded.
+        """
+        tokens, blinded_tokens = RandomToken.create_and_blind_many(
+            count,
+            seeded_random_bytes(seed),
+        )
+        self.expectThat(
+            list(t.encode_base64() for t in tokens),
+            Equals(list(
+                t.encode_base64()
+                for t
+                in RandomToken.create_many(count, seeded_random_bytes(seed))
+            )),
+        )
+        self.expectThat(
+            list(t.encode_base64() for t in blinded_tokens),
+            Equals(list(t.blind().encode_base64() for t in tokens)),
+        )
+
 
 class SigningKeyTests(TestCase):
     """
@@ -130,6 +419,17 @@ class SigningKeyTests(TestCase):
     def test_serialization_roundtrip(self, signing_key):
         self.assertThat(signing_key, RoundTripsThroughBase64())
 
+    @given(binary(min_size=1))
+    def test_seeded(self, seed):
+        """
+        ``random_signing_key`` returns the same key each time it is called
+        with randomness from ``seeded_random_bytes`` with the same seed.
+        """
+        self.assertThat(
+            random_signing_key(seeded_random_bytes(seed)).encode_base64(),
+            Equals(random_signing_key(seeded_random_bytes(seed)).encode_base64()),
+        )
+
     @given(signing_keys(), random_tokens())
     def test_rederive_unblinded_token(self, signing_key, token):
         """
@@ -276,6 +576,120 @@ class BatchDLEQProofTests(TestCase):
             raises(ValueError),
         )
 
+    @given(signing_keys(), lists(random_tokens()))
+    def test_valid(self, signing_key, tokens):
+        """
+        ``BatchDLEQProof.invalid`` returns ``False`` for a proof created for the
+        given tokens with the signing key corresponding to the given public
+        key.
+        """
+        blinded_tokens = RandomToken.blind_many(tokens)
+        signed_tokens = list(map(signing_key.sign, blinded_tokens))
+        proof = BatchDLEQProof.create(
+            signing_key, blinded_tokens, signed_tokens,
+        )
+        self.assertThat(
+            proof.invalid(
+                blinded_tokens,
+                signed_tokens,
+                PublicKey.from_signing_key(signing_key),
+            ),
+            Equals(False),
+        )
+
+    @given(signing_keys(), signing_keys(), lists(random_tokens(), min_size=1))
+    def test_invalid(self, signing_key_a, signing_key_b, tokens):
+        """
+        ``BatchDLEQProof.invalid`` returns ``True`` for a proof checked against
+        the wrong public key or the wrong signed tokens.
+        """
+        assume(signing_key_a.encode_base64() != signing_key_b.encode_base64())
+        blinded_tokens = RandomToken.blind_many(tokens)
+        signed_tokens = list(map(signing_key_a.sign, blinded_tokens))
+        proof = BatchDLEQProof.create(
+            signing_key_a, blinded_tokens, signed_tokens,
+        )
+        self.expectThat(
+            proof.invalid(
+                blinded_tokens,
+                signed_tokens,
+                PublicKey.from_signing_key(signing_key_b),
+            ),
+            Equals(True),
+            "wrong public key",
+        )
+        self.expectThat(
+            proof.invalid(
+                blinded_tokens,
+                list(map(signing_key_b.sign, blinded_tokens)),
+                PublicKey.from_signing_key(signing_key_a),
+            ),
+            Equals(True),
+            "wrong signed tokens",
+        )
+
+    @given(signing_keys(), lists(random_tokens()))
+    def test_builder(self, signing_key, tokens):
+        """
+        ``BatchDLEQProofBuilder`` creates a valid proof for the tokens it signs
+        and the pairs added to it.
+        """
+        blinded_tokens = RandomToken.blind_many(tokens)
+        builder = BatchDLEQProofBuilder(signing_key)
+        half = len(blinded_tokens) // 2
+        signed_tokens = list(map(builder.sign, blinded_tokens[:half]))
+        for blinded_token in blinded_tokens[half:]:
+            signed_token = signing_key.sign(blinded_token)
+            builder.add(blinded_token, signed_token)
+            signed_tokens.append(signed_token)
+        self.expectThat(len(builder), Equals(len(blinded_tokens)))
+        if not blinded_tokens:
+            self.expectThat(builder.finish, raises(ValueError))
+            return
+        proof = builder.finish()
+        self.expectThat(
+            proof.invalid(
+                blinded_tokens,
+                signed_tokens,
+                PublicKey.from_signing_key(signing_key),
+            ),
+            Equals(False),
+        )
+        self.expectThat(builder.finish, raises(ValueError))
+
+    def test_builder_destroyed_token(self):
+        """
+        ``BatchDLEQProofBuilder.finish`` raises ``TypeError`` rather than
+        passing a destroyed token to the native library.
+        """
+        signing_key = random_signing_key()
+        builder = BatchDLEQProofBuilder(signing_key)
+        with Arena():
+            builder.sign(RandomToken.create().blind())
+        self.assertThat(builder.finish, raises(TypeError))
+
+    @given(signing_keys(), lists(random_tokens()))
+    def test_unblind_many(self, signing_key, tokens):
+        """
+        ``RandomToken.unblind_many`` returns the same unblinded tokens as
+        ``BatchDLEQProof.invalid_or_unblind``.
+        """
+        blinded_tokens = RandomToken.blind_many(tokens)
+        signed_tokens = list(map(signing_key.sign, blinded_tokens))
+        proof = BatchDLEQProof.create(
+            signing_key, blinded_tokens, signed_tokens,
+        )
+        unblinded_tokens = proof.invalid_or_unblind(
+            tokens,
+            blinded_tokens,
+            signed_tokens,
+            PublicKey.from_signing_key(signing_key),
+        )
+        self.assertThat(
+            list(t.encode_base64() for t in RandomToken.unblind_many(tokens, signed_tokens)),
+            Equals(list(t.encode_base64() for t in unblinded_tokens)),
+        )
+
     @given(signing_keys(), signing_keys(), random_tokens(), random_tokens())
     def test_improperly_signed_tokens(self, signing_key_a, signing_key_b, token_a, token_b):
         """
@@ -505,6 +919,7 @@ class VerificationKeyTests(TestCase):
         ``VerificationKey.invalid_sha512`` returns ``True`` if passed a signature
         created with a different key and the same message.
         """
+        assume(token_a.encode_base64() != token_b.encode_base64())
         key_a = get_verify_key(signing_key, token_a)
         key_b = get_verify_key(signing_key, token_b)
         sig_a = key_a.sign_sha512(message)
@@ -550,6 +965,44 @@ class VerificationKeyTests(TestCase):
         self.assertThat(key.invalid_sha512(sig, message), Equals(False))
 
 
+class VerificationKeyManyTests(TestCase):
+    """
+    Tests related to ``VerificationKey.invalid_sha512_many``.
+    """
+    @given(signing_keys(), lists(random_tokens(), max_size=8), lists(booleans(), min_size=8, max_size=8), messages())
+    def test_bitmap(self, signing_key, tokens, corrupt, message):
+        """
+        ``VerificationKey.invalid_sha512_many`` returns a bitmap with the same
+        bits set as ``VerificationKey.invalid_sha512`` returns ``True`` for.
+        """
+        keys = list(get_verify_key(signing_key, token) for token in tokens)
+        signatures = list(
+            key.sign_sha512(message + b"x" if bad else message)
+            for (key, bad)
+            in zip(keys, corrupt)
+        )
+        self.assertThat(
+            VerificationKey.invalid_sha512_many(keys, signatures, message),
+            Equals(sum(
+                1 << n
+                for (n, (key, signature))
+                in enumerate(zip(keys, signatures))
+                if key.invalid_sha512(signature, message)
+            )),
+        )
+
+    def test_mismatched(self):
+        """
+        ``VerificationKey.invalid_sha512_many`` raises ``ValueError`` if the
+        number of keys and signatures differ.
+        """
+        key = get_verify_key(random_signing_key(), RandomToken.create())
+        self.assertThat(
+            lambda: VerificationKey.invalid_sha512_many([key], [], b"message"),
+            raises(ValueError),
+        )
+
+
 class VerificationSignatureTests(TestCase):
     """
     Tests related to ``VerificationSignature``.
@@ -0,0 +1,113 @@
+from collections import (
+    Counter,
+)
+from os import (
+    urandom,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    AllMatch,
+    Equals,
+    GreaterThan,
+    LessThan,
+    raises,
+)
+
+from ..router import (
+    HashRing,
+    Router,
+)
+
+
+def digests(count):
+    return list(urandom(16) for _ in range(count))
+
+
+class HashRingTests(TestCase):
+    """
+    Tests related to ``HashRing``.
+    """
+    def test_stable(self):
+        """
+        Rings built from the same workers agree on the owner of every digest,
+        whatever order the workers are given in.
+        """
+        a = HashRing(["w0", "w1", "w2"])
+        b = HashRing(["w2", "w0", "w1"])
+        sample = digests(200)
+        self.assertThat(list(map(a.owner, sample)), Equals(list(map(b.owner, sample))))
+
+    def test_balance(self):
+        """
+        Each worker owns a reasonable share of the digests.
+        """
+        ring = HashRing(["w0", "w1", "w2", "w3"])
+        counts = Counter(map(ring.owner, digests(4000)))
+        self.assertThat(
+            list(counts[worker] for worker in ring.workers),
+            AllMatch(GreaterThan(500)),
+        )
+
+    def test_remove(self):
+        """
+        Removing a worker moves only the digests it owned.
+        """
+        ring = HashRing(["w0", "w1", "w2", "w3"])
+        sample = digests(1000)
+        before = list(map(ring.owner, sample))
+        ring.remove("w3")
+        after = list(map(ring.owner, sample))
+        moved = list(b for (b, a) in zip(before, after) if a != b)
+        self.expectThat(set(moved), Equals({"w3"} if moved else set()))
+        self.expectThat(len(moved), LessThan(500))
+
+    def test_no_workers(self):
+        """
+        A ``HashRing`` needs at least one worker.
+        """
+        self.expectThat(lambda: HashRing([]), raises(ValueError))
+        self.expectThat(lambda: HashRing(["w0"]).remove("w0"), raises(ValueError))
+
+
+class RouterTests(TestCase):
+    """
+    Tests related to ``Router``.
+    """
+    def test_roundtrip(self):
+        """
+        ``Router.gather`` puts results computed per worker back in the order
+        of the batch given to ``Router.partition``.
+        """
+        router = Router(HashRing(["w0", "w1", "w2"]), digest=lambda item: item)
+        items = digests(50)
+        batches = router.partition(items)
+        for (worker, (_, owned)) in batches.items():
+            self.expectThat(
+                list(map(router.ring.owner, owned)),
+                AllMatch(Equals(worker)),
+            )
+        results = {
+            worker: list((worker, item) for item in owned)
+            for (worker, (_, owned))
+            in batches.items()
+        }
+        self.assertThat(
+            router.gather(len(items), batches, results),
+            Equals(list((router.ring.owner(item), item) for item in items)),
+        )
+
+    def test_short_results(self):
+        """
+        ``Router.gather`` raises ``ValueError`` if a worker gives the wrong
+        number of results.
+        """
+        router = Router(HashRing(["w0"]), digest=lambda item: item)
+        items = digests(3)
+        batches = router.partition(items)
+        self.assertThat(
+            lambda: router.gather(3, batches, {"w0": [True]}),
+            raises(ValueError),
+        )
@@ -0,0 +1,194 @@
+from multiprocessing import (
+    Pool,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    Is,
+    IsInstance,
+    Not,
+)
+
+from .. import (
+    Arena,
+    BlindedToken,
+    DecodeException,
+    PublicKey,
+    RandomToken,
+    random_signing_key,
+)
+from ..sharing import (
+    SharedBatch,
+    SharedSigningKey,
+)
+from .util import (
+    encoded,
+)
+
+
+def _sign_shared(names):
+    keyring_name, batch_name = names
+    keyring = SharedSigningKey.attach(keyring_name)
+    batch = SharedBatch.attach(batch_name)
+    try:
+        with keyring.current() as keys:
+            return encoded(map(keys.signing_key.sign, batch.decode_all()))
+    finally:
+        batch.close()
+        keyring.close()
+
+
+class SharedBatchTests(TestCase):
+    """
+    Tests related to ``SharedBatch``.
+    """
+    def test_roundtrip(self):
+        """
+        Objects put into a ``SharedBatch`` can be decoded again by anything
+        attached to it.
+        """
+        _, blinded_tokens = RandomToken.create_and_blind_many(5)
+        with SharedBatch.create(blinded_tokens) as batch:
+            with SharedBatch.attach(batch.name) as attached:
+                self.expectThat(len(attached), Equals(5))
+                self.expectThat(attached.type, Equals(BlindedToken))
+                self.expectThat(
+                    encoded(attached.decode_all()),
+                    Equals(encoded(blinded_tokens)),
+                )
+                self.expectThat(
+                    attached[3].encode_base64(),
+                    Equals(blinded_tokens[3].encode_base64()),
+                )
+                self.expectThat(
+                    encoded(attached.decode_all(1, 3)),
+                    Equals(encoded(blinded_tokens[1:3])),
+                )
+
+    def test_mixed_types(self):
+        """
+        ``SharedBatch.create`` rejects objects of more than one type.
+        """
+        tokens, blinded_tokens = RandomToken.create_and_blind_many(1)
+        self.assertRaises(
+            ValueError,
+            SharedBatch.create,
+            blinded_tokens + tokens,
+        )
+
+    def test_not_a_batch(self):
+        """
+        ``SharedBatch.attach`` rejects a segment which does not hold a batch.
+        """
+        with SharedSigningKey.create(random_signing_key()) as keyring:
+            self.assertRaises(DecodeException, SharedBatch.attach, keyring.name)
+
+    def test_workers(self):
+        """
+        Worker processes can sign a shared batch with a shared key.
+        """
+        signing_key = random_signing_key()
+        _, blinded_tokens = RandomToken.create_and_blind_many(4)
+        expected = encoded(map(signing_key.sign, blinded_tokens))
+        with SharedSigningKey.create(signing_key) as keyring:
+            with SharedBatch.create(blinded_tokens) as batch:
+                with Pool(2) as pool:
+                    results = pool.map(_sign_shared, [(keyring.name, batch.name)] * 2)
+        self.assertThat(results, Equals([expected] * 2))
+
+
+class SharedSigningKeyTests(TestCase):
+    """
+    Tests related to ``SharedSigningKey``.
+    """
+    def test_rotate(self):
+        """
+        A process attached to a ``SharedSigningKey`` sees the new key after
+        the creator rotates it and decodes the key only once per rotation.
+        """
+        first = random_signing_key()
+        second = random_signing_key()
+        with SharedSigningKey.create(first) as keyring:
+            with SharedSigningKey.attach(keyring.name) as attached:
+                with attached.current() as keys:
+                    self.expectThat(
+                        keys.signing_key.encode_base64(),
+                        Equals(first.encode_base64()),
+                    )
+                with attached.current() as again:
+                    self.expectThat(again, Is(keys))
+
+                generation = attached.generation()
+                keyring.rotate(second)
+                self.expectThat(attached.generation(), Equals(generation + 2))
+                with attached.current() as rotated:
+                    self.expectThat(
+                        rotated.signing_key.encode_base64(),
+                        Equals(second.encode_base64()),
+                    )
+                    self.expectThat(rotated.public_key, IsInstance(PublicKey))
+                    self.expectThat(
+                        rotated.public_key.encode_base64(),
+                        Equals(PublicKey.from_signing_key(second).encode_base64()),
+                    )
+                self.expectThat(keys.signing_key._raw, Equals(None))
+
+    def test_rotate_while_in_use(self):
+        """
+        Keys in use by a ``with`` block are not destroyed when another use
+        notices a rotation, or when the ``SharedSigningKey`` is closed, until
+        the block exits.
+        """
+        first = random_signing_key()
+        with SharedSigningKey.create(first) as keyring:
+            attached = SharedSigningKey.attach(keyring.name)
+            with attached.current() as keys:
+                keyring.rotate(random_signing_key())
+                with attached.current() as rotated:
+                    self.expectThat(rotated, Not(Is(keys)))
+                self.expectThat(
+                    keys.signing_key.encode_base64(),
+                    Equals(first.encode_base64()),
+                )
+                attached.close()
+                self.expectThat(
+                    rotated.signing_key._raw,
+                    Equals(None),
+                )
+                self.expectThat(
+                    keys.public_key.encode_base64(),
+                    Equals(PublicKey.from_signing_key(first).encode_base64()),
+                )
+            self.expectThat(keys.signing_key._raw, Equals(None))
+            self.expectThat(keys.public_key._raw, Equals(None))
+
+    def test_first_use_in_arena(self):
+        """
+        Keys first decoded inside an ``Arena`` outlive it.
+        """
+        signing_key = random_signing_key()
+        with SharedSigningKey.create(signing_key) as keyring:
+            with SharedSigningKey.attach(keyring.name) as attached:
+                with Arena():
+                    with attached.current():
+                        pass
+                with attached.current() as keys:
+                    self.expectThat(
+                        keys.signing_key.encode_base64(),
+                        Equals(signing_key.encode_base64()),
+                    )
+                    self.expectThat(
+                        keys.public_key.encode_base64(),
+                        Equals(PublicKey.from_signing_key(signing_key).encode_base64()),
+                    )
+
+    def test_rotate_attached(self):
+        """
+        Only the creator of a ``SharedSigningKey`` can rotate it.
+        """
+        with SharedSigningKey.create(random_signing_key()) as keyring:
+            with SharedSigningKey.attach(keyring.name) as attached:
+                self.assertRaises(ValueError, attached.rotate, random_signing_key())
@@ -0,0 +1,213 @@
+from multiprocessing import (
+    Pool,
+)
+from zlib import (
+    compress,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    HasLength,
+    raises,
+)
+
+from .. import (
+    DecodeException,
+    RandomToken,
+    TokenPreimage,
+    random_signing_key,
+)
+from ..spent import (
+    DIGEST_SIZE,
+    SpentTokens,
+    UnknownEpochException,
+    decode_delta,
+    encode_delta,
+    preimage_digest,
+)
+
+
+def preimages(count):
+    signing_key = random_signing_key()
+    tokens, blinded_tokens = RandomToken.create_and_blind_many(count)
+    return list(
+        unblinded_token.preimage()
+        for unblinded_token
+        in RandomToken.unblind_many(tokens, list(map(signing_key.sign, blinded_tokens)))
+    )
+
+
+def _node_spend(encoded_preimages):
+    # One node redeems some tokens and exports what it saw.
+    spent = SpentTokens()
+    spent.open("k")
+    for encoded in encoded_preimages:
+        spent.spend("k", [TokenPreimage.decode_base64(encoded)])
+    delta, _ = spent.export_delta("k")
+    return delta
+
+
+def _node_restart(deltas):
+    # A node comes back with its own state and catches up from the others,
+    # seeing some deltas more than once.
+    spent = SpentTokens()
+    spent.open("k")
+    for delta in deltas + deltas[::-1]:
+        spent.merge_delta("k", delta)
+    delta, _ = spent.export_delta("k")
+    return delta
+
+
+class PreimageDigestTests(TestCase):
+    """
+    Tests related to ``preimage_digest``.
+    """
+    def test_stable(self):
+        """
+        ``preimage_digest`` gives the same digest for a preimage and a decoded
+        copy of it and different digests for different preimages.
+        """
+        a, b = preimages(2)
+        copy = TokenPreimage.decode_base64(a.encode_base64())
+        self.expectThat(preimage_digest(a), HasLength(DIGEST_SIZE))
+        self.expectThat(preimage_digest(copy), Equals(preimage_digest(a)))
+        self.expectThat(preimage_digest(b) == preimage_digest(a), Equals(False))
+
+
+class SpentTokensTests(TestCase):
+    """
+    Tests related to ``SpentTokens``.
+    """
+    def test_double_spend(self):
+        """
+        ``SpentTokens.spend`` reports tokens which were spent before and
+        records nothing from a batch containing one.
+        """
+        a, b, c = preimages(3)
+        spent = SpentTokens()
+        spent.open("k1")
+        self.expectThat(spent.spend("k1", [a]), Equals([False]))
+        self.expectThat(spent.spend("k1", [b, a]), Equals([False, True]))
+        self.expectThat(spent.spent("k1", [a, b]), Equals([True, False]))
+        self.expectThat(spent.spend("k1", [c, c]), Equals([False, True]))
+        self.expectThat(spent.spend("k1", [b, c]), Equals([False, False]))
+
+    def test_partitions(self):
+        """
+        Tokens spent in one epoch are not spent in another.
+        """
+        (a,) = preimages(1)
+        spent = SpentTokens()
+        spent.open("k1")
+        spent.open("k2")
+        spent.spend("k1", [a])
+        self.expectThat(spent.spent("k2", [a]), Equals([False]))
+        self.expectThat(spent.stats().sizes, Equals({"k1": 1, "k2": 0}))
+
+    def test_retire(self):
+        """
+        ``SpentTokens.retire`` drops an epoch and tokens can no longer be
+        checked against it.
+        """
+        (a,) = preimages(1)
+        spent = SpentTokens()
+        spent.open("k1")
+        spent.spend("k1", [a])
+        spent.retire("k1")
+        spent.retire("k1")
+        self.expectThat(spent.epochs(), Equals([]))
+        self.expectThat(spent.stats().retired, Equals(1))
+        self.expectThat(
+            lambda: spent.spend("k1", [a]),
+            raises(UnknownEpochException),
+        )
+
+    def test_export_since(self):
+        """
+        ``SpentTokens.export_delta`` includes only tokens recorded after the
+        given position.
+        """
+        a, b = preimages(2)
+        spent = SpentTokens()
+        spent.open("k1")
+        spent.spend("k1", [a])
+        first, position = spent.export_delta("k1")
+        spent.spend("k1", [b])
+        second, _ = spent.export_delta("k1", position)
+        self.expectThat(decode_delta(first), Equals([preimage_digest(a)]))
+        self.expectThat(decode_delta(second), Equals([preimage_digest(b)]))
+
+    def test_merge_idempotent(self):
+        """
+        ``SpentTokens.merge_delta`` records the tokens in a delta once no
+        matter how many times it is merged.
+        """
+        a, b = preimages(2)
+        source = SpentTokens()
+        source.open("k1")
+        source.spend("k1", [a, b])
+        delta, _ = source.export_delta("k1")
+
+        spent = SpentTokens()
+        spent.open("k1")
+        self.expectThat(spent.merge_delta("k1", delta), Equals(2))
+        self.expectThat(spent.merge_delta("k1", delta), Equals(0))
+        self.expectThat(spent.spend("k1", [a]), Equals([True]))
+        self.expectThat(spent.export_delta("k1")[0], Equals(delta))
+
+    def test_convergence(self):
+        """
+        Several node processes which redeem overlapping tokens and then merge
+        each other's deltas all end up with the same spent set.
+        """
+        encoded = list(p.encode_base64() for p in preimages(12))
+        assignments = [encoded[0:5], encoded[4:9], encoded[8:12] + encoded[:1]]
+        with Pool(3) as pool:
+            deltas = pool.map(_node_spend, assignments)
+            restarted = pool.map(_node_restart, [deltas] * 3)
+        expected = encode_delta(
+            preimage_digest(TokenPreimage.decode_base64(e)) for e in encoded
+        )
+        self.assertThat(restarted, Equals([expected] * 3))
+
+
+class DeltaTests(TestCase):
+    """
+    Tests related to ``encode_delta`` and ``decode_delta``.
+    """
+    def test_roundtrip(self):
+        """
+        ``decode_delta`` returns the distinct digests given to
+        ``encode_delta``, sorted.
+        """
+        digests = [b"b" * DIGEST_SIZE, b"a" * DIGEST_SIZE, b"b" * DIGEST_SIZE]
+        self.assertThat(
+            decode_delta(encode_delta(digests)),
+            Equals([b"a" * DIGEST_SIZE, b"b" * DIGEST_SIZE]),
+        )
+
+    def test_malformed(self):
+        """
+        ``decode_delta`` raises ``DecodeException`` for malformed deltas.
+        """
+        delta = encode_delta([b"a" * DIGEST_SIZE])
+        for malformed in [b"", b"XXXX" + delta[4:], delta[:-1], delta[:10] + b"junk"]:
+            self.expectThat(
+                lambda: decode_delta(malformed),
+                raises(DecodeException),
+                repr(malformed),
+            )
+
+    def test_expands_too_far(self):
+        """
+        ``decode_delta`` raises ``DecodeException`` for a delta which
+        decompresses to more digests than its header says.
+        """
+        header = encode_delta([b"a" * DIGEST_SIZE])[:10]
+        self.assertThat(
+            lambda: decode_delta(header + compress(b"a" * DIGEST_SIZE * 100000)),
+            raises(DecodeException),
+        )
@@ -0,0 +1,66 @@
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    raises,
+)
+from hypothesis import (
+    given,
+)
+from hypothesis.strategies import (
+    integers,
+    lists,
+)
+
+from ..stats import (
+    Histogram,
+    exponential_bounds,
+)
+
+
+class HistogramTests(TestCase):
+    """
+    Tests related to ``Histogram``.
+    """
+    def test_rejects_unordered_bounds(self):
+        """
+        ``Histogram`` raises ``ValueError`` if its bounds are not increasing.
+        """
+        self.assertThat(lambda: Histogram([2, 1]), raises(ValueError))
+
+    @given(lists(integers(min_value=0, max_value=100)))
+    def test_record(self, values):
+        """
+        ``Histogram.record`` counts each value in the first bucket with a bound
+        not less than the value.
+        """
+        histogram = Histogram([1, 10, 50])
+        for value in values:
+            histogram.record(value)
+        snapshot = histogram.snapshot()
+        self.expectThat(
+            snapshot.counts,
+            Equals((
+                len(list(v for v in values if v <= 1)),
+                len(list(v for v in values if 1 < v <= 10)),
+                len(list(v for v in values if 10 < v <= 50)),
+                len(list(v for v in values if 50 < v)),
+            )),
+        )
+        self.expectThat(snapshot.count, Equals(len(values)))
+        self.expectThat(snapshot.total, Equals(sum(values)))
+
+    def test_quantile(self):
+        """
+        ``HistogramSnapshot.quantile`` returns the upper bound of the bucket
+        holding the requested quantile.
+        """
+        histogram = Histogram(exponential_bounds(1, 2, 4))
+        for value in [1, 1, 3, 7, 8]:
+            histogram.record(value)
+        snapshot = histogram.snapshot()
+        self.expectThat(snapshot.quantile(0.4), Equals(1))
+        self.expectThat(snapshot.quantile(0.5), Equals(4))
+        self.expectThat(snapshot.quantile(1.0), Equals(8))
+        self.expectThat(Histogram([1]).snapshot().quantile(0.5), Equals(None))
@@ -0,0 +1,123 @@
+from json import (
+    loads,
+)
+from os.path import (
+    join,
+)
+from shutil import (
+    rmtree,
+)
+from tempfile import (
+    mkdtemp,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    GreaterThan,
+    MatchesAny,
+    Not,
+)
+
+from .. import tuning
+from ..tuning import (
+    OPERATIONS,
+    Measurement,
+    Profile,
+    calibrate,
+    choose,
+    host,
+    load_or_calibrate,
+)
+
+# Small enough to keep the tests quick.
+FAST = dict(chunk_sizes=(1, 2), thread_counts=(1, 2), repeat=1)
+
+
+class ChooseTests(TestCase):
+    """
+    Tests related to ``choose``.
+    """
+    def test_within_slo(self):
+        """
+        ``choose`` picks the highest throughput within the latency target.
+        """
+        measurements = [
+            Measurement(chunk_size=8, threads=1, latency=0.001, throughput=100),
+            Measurement(chunk_size=64, threads=1, latency=0.004, throughput=300),
+            Measurement(chunk_size=512, threads=1, latency=0.020, throughput=400),
+        ]
+        self.assertThat(choose(measurements, 0.005), Equals(measurements[1]))
+
+    def test_none_within_slo(self):
+        """
+        ``choose`` picks the lowest latency if nothing meets the target.
+        """
+        measurements = [
+            Measurement(chunk_size=8, threads=2, latency=0.030, throughput=100),
+            Measurement(chunk_size=8, threads=1, latency=0.020, throughput=50),
+        ]
+        self.assertThat(choose(measurements, 0.005), Equals(measurements[1]))
+
+
+class CalibrateTests(TestCase):
+    """
+    Tests related to ``calibrate`` and ``load_or_calibrate``.
+    """
+    def setUp(self):
+        super(CalibrateTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+        self.path = join(self.directory, "tuning.json")
+
+    def test_calibrate(self):
+        """
+        ``calibrate`` chooses, for every operation, what ``choose`` picks from
+        the combinations it measured.
+        """
+        measured = {}
+        real_measure = tuning.measure
+
+        def measure(fixtures, operation, *a):
+            measurement = real_measure(fixtures, operation, *a)
+            measured.setdefault(operation, []).append(measurement)
+            return measurement
+
+        self.patch(tuning, "measure", measure)
+        profile = calibrate(slo=10, **FAST)
+        self.expectThat(sorted(profile.operations), Equals(sorted(OPERATIONS)))
+        for (operation, measurement) in profile.operations.items():
+            self.expectThat(measurement.chunk_size, MatchesAny(Equals(1), Equals(2)))
+            self.expectThat(measurement.throughput, GreaterThan(0))
+            self.expectThat(measurement, Equals(choose(measured[operation], 10)))
+        self.expectThat(Profile.from_json(profile.to_json()), Equals(profile))
+
+    def test_reuse(self):
+        """
+        ``load_or_calibrate`` reuses a saved profile for the same host and
+        target and calibrates again for a different target.
+        """
+        first = load_or_calibrate(self.path, slo=10, **FAST)
+        self.expectThat(load_or_calibrate(self.path, slo=10, **FAST), Equals(first))
+        with open(self.path) as f:
+            self.expectThat(loads(f.read())["host"], Equals(host()))
+        second = load_or_calibrate(self.path, slo=20, **FAST)
+        self.expectThat(second, Not(Equals(first)))
+        self.expectThat(Profile.load(self.path), Equals(second))
+
+    def test_other_host(self):
+        """
+        ``load_or_calibrate`` does not reuse a profile made on another host.
+        """
+        profile = calibrate(slo=10, **FAST)
+        Profile(
+            host=dict(profile.host, cpu_count=-1),
+            slo=10,
+            operations=profile.operations,
+        ).save(self.path)
+        self.assertThat(
+            load_or_calibrate(self.path, slo=10, **FAST).host,
+            Equals(host()),
+        )
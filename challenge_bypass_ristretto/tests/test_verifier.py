@@ -0,0 +1,119 @@
+from threading import (
+    Thread,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    raises,
+)
+
+from .. import (
+    random_signing_key,
+)
+from ..verifier import (
+    BatchingVerifier,
+)
+from .. import diagnostics
+from .util import (
+    make_passes,
+)
+
+
+class BatchingVerifierTests(TestCase):
+    """
+    Tests related to ``BatchingVerifier``.
+    """
+    def setUp(self):
+        super(BatchingVerifierTests, self).setUp()
+        self.signing_key = random_signing_key()
+
+    def test_not_running(self):
+        """
+        ``BatchingVerifier.submit`` raises ``ValueError`` if the verifier is not
+        started.
+        """
+        verifier = BatchingVerifier(self.signing_key)
+        self.assertThat(
+            lambda: verifier.submit(b"message", []),
+            raises(ValueError),
+        )
+
+    def test_valid_and_invalid(self):
+        """
+        ``BatchingVerifier.verify`` returns ``False`` for each valid pass and
+        ``True`` for each pass made for a different message.
+        """
+        passes = make_passes(self.signing_key, b"message", 3)
+        wrong = make_passes(self.signing_key, b"other message", 1)
+        with BatchingVerifier(self.signing_key) as verifier:
+            self.assertThat(
+                verifier.verify(b"message", passes[:2] + wrong + passes[2:], 10),
+                Equals([False, False, True, False]),
+            )
+
+    def test_concurrent_requests(self):
+        """
+        ``BatchingVerifier`` delivers each concurrent caller the results for
+        its own passes, and batches those passes together.
+        """
+        requests = list(
+            (message, make_passes(self.signing_key, message, 2))
+            for message
+            in (b"message %d" % (n,) for n in range(8))
+        )
+        results = {}
+        verifier = BatchingVerifier(self.signing_key, flush_size=16, deadline=1.0)
+
+        def verify(message, passes):
+            # Swap the signatures so that exactly the second pass is invalid.
+            results[message] = verifier.verify(
+                message,
+                [passes[0], (passes[1][0], passes[0][1])],
+                10,
+            )
+
+        with verifier:
+            threads = list(Thread(target=verify, args=r) for r in requests)
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.expectThat(
+            results,
+            Equals(dict((message, [False, True]) for (message, _) in requests)),
+        )
+        self.expectThat(verifier.latency.snapshot().count, Equals(8))
+        fill = verifier.batch_fill.snapshot()
+        self.expectThat(fill.total, Equals(16))
+        self.expectThat(fill.count, Equals(1))
+
+    def test_bad_request(self):
+        """
+        If verifying one request's passes raises an exception then only that
+        request's result fails.
+        """
+        passes = make_passes(self.signing_key, b"message", 2)
+        with BatchingVerifier(self.signing_key, deadline=1.0, flush_size=3) as verifier:
+            good = verifier.submit(b"message", passes)
+            bad = verifier.submit(b"message", [(None, None)])
+            self.expectThat(good.result(10), Equals([False, False]))
+            self.expectThat(lambda: bad.result(10), raises(Exception))
+
+    def test_no_leak(self):
+        """
+        ``BatchingVerifier`` destroys the native objects it makes to verify a
+        batch.
+        """
+        passes = make_passes(self.signing_key, b"message", 3)
+        self.addCleanup(diagnostics.disable)
+        diagnostics.enable()
+        with BatchingVerifier(self.signing_key) as verifier:
+            verifier.verify(b"message", passes, 10)
+        usage = diagnostics.snapshot()
+        self.expectThat(usage["UnblindedToken"].live, Equals(0))
+        self.expectThat(usage["VerificationKey"].live, Equals(0))
+        self.expectThat(usage["VerificationKey"].allocated, Equals(3))
@@ -0,0 +1,130 @@
+from io import (
+    BytesIO,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    raises,
+)
+from hypothesis import (
+    given,
+)
+from hypothesis.strategies import (
+    integers,
+)
+
+from .. import (
+    RandomToken,
+    BatchDLEQProof,
+    DecodeException,
+    random_signing_key,
+)
+from ..wire import (
+    WireFormatException,
+    ISSUE_RESPONSE,
+    Writer,
+    write_issue_request,
+    read_issue_request,
+    write_issue_response,
+    read_issue_response,
+    write_redemption,
+    read_redemption,
+)
+from .util import (
+    encoded,
+    make_passes,
+)
+
+
+class WireTests(TestCase):
+    """
+    Tests related to the binary container format.
+    """
+    @given(integers(min_value=0, max_value=8))
+    def test_issue_request_roundtrip(self, count):
+        """
+        Blinded tokens written by ``write_issue_request`` are read back
+        unchanged by ``read_issue_request``.
+        """
+        _, blinded_tokens = RandomToken.create_and_blind_many(count)
+        stream = BytesIO()
+        write_issue_request(stream, blinded_tokens)
+        stream.seek(0)
+        self.assertThat(
+            encoded(read_issue_request(stream)),
+            Equals(encoded(blinded_tokens)),
+        )
+
+    @given(integers(min_value=0, max_value=8))
+    def test_issue_response_roundtrip(self, count):
+        """
+        Signed tokens and a proof written by ``write_issue_response`` are read
+        back unchanged by ``read_issue_response``.
+        """
+        signing_key = random_signing_key()
+        _, blinded_tokens = RandomToken.create_and_blind_many(count)
+        signed_tokens = list(map(signing_key.sign, blinded_tokens))
+        proof = BatchDLEQProof.create(signing_key, blinded_tokens, signed_tokens)
+        stream = BytesIO()
+        write_issue_response(stream, signed_tokens, proof)
+        stream.seek(0)
+        read_signed_tokens, read_proof = read_issue_response(stream)
+        self.expectThat(encoded(read_signed_tokens), Equals(encoded(signed_tokens)))
+        self.expectThat(read_proof.encode_base64(), Equals(proof.encode_base64()))
+
+    @given(integers(min_value=0, max_value=8))
+    def test_redemption_roundtrip(self, count):
+        """
+        Passes written by ``write_redemption`` are read back unchanged by
+        ``read_redemption``.
+        """
+        passes = make_passes(random_signing_key(), b"message", count)
+        stream = BytesIO()
+        write_redemption(stream, passes)
+        stream.seek(0)
+        self.assertThat(
+            list(map(encoded, read_redemption(stream))),
+            Equals(list(map(encoded, passes))),
+        )
+
+    def test_wrong_kind(self):
+        """
+        Reading a container of one kind as another raises
+        ``WireFormatException``.
+        """
+        stream = BytesIO()
+        write_issue_request(stream, [])
+        stream.seek(0)
+        self.assertThat(
+            lambda: read_redemption(stream),
+            raises(WireFormatException),
+        )
+
+    def test_malformed(self):
+        """
+        Reading a container with a bad header or truncated content raises
+        ``WireFormatException``, which is a ``DecodeException``.
+        """
+        _, blinded_tokens = RandomToken.create_and_blind_many(2)
+        stream = BytesIO()
+        write_issue_request(stream, blinded_tokens)
+        data = stream.getvalue()
+        self.expectThat(
+            lambda: read_issue_request(BytesIO(b"XXXX" + data[4:])),
+            raises(WireFormatException),
+        )
+        self.expectThat(
+            lambda: read_issue_request(BytesIO(data[:-1])),
+            raises(DecodeException),
+        )
+
+    def test_writer_count(self):
+        """
+        ``Writer.finish`` raises ``ValueError`` if fewer records were written
+        than promised.
+        """
+        writer = Writer(BytesIO(), ISSUE_RESPONSE, 1)
+        self.assertThat(lambda: writer.finish(), raises(ValueError))
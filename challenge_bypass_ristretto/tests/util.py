@@ -0,0 +1,55 @@
+"""
+Helpers shared by the test modules.
+"""
+
+from .. import (
+    RandomToken,
+)
+from ..corpus import (
+    generate,
+)
+
+# The corpus made by ``sample_corpus``, so it is only made once per test run.
+_corpora = {}
+
+
+def encoded(natives):
+    """
+    :return: A ``list`` of the base64 encoding of each of ``natives``.
+    """
+    return list(native.encode_base64() for native in natives)
+
+
+def encoded_text(natives):
+    """
+    :return: A ``list`` of the base64 encoding of each of ``natives`` as
+        text, as it appears in JSON.
+    """
+    return list(text.decode("ascii") for text in encoded(natives))
+
+
+def make_passes(signing_key, message, count):
+    """
+    Make some passes for the given message from tokens signed by the given
+    signing key.
+    """
+    tokens, blinded_tokens = RandomToken.create_and_blind_many(count)
+    signed_tokens = list(map(signing_key.sign, blinded_tokens))
+    return list(
+        (
+            unblinded_token.preimage(),
+            unblinded_token.derive_verification_key_sha512().sign_sha512(message),
+        )
+        for unblinded_token
+        in RandomToken.unblind_many(tokens, signed_tokens)
+    )
+
+
+def sample_corpus():
+    """
+    Get the corpus generated from the default seed, for tests which need
+    some valid keys, tokens, proofs and passes to work on.
+    """
+    if "sample" not in _corpora:
+        _corpora["sample"] = generate()
+    return _corpora["sample"]
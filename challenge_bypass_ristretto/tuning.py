@@ -0,0 +1,322 @@
+"""
+Choice of batch sizes and thread counts for the batch operations, by
+measuring them on the current host.
+
+The best chunk size for ``BatchDLEQProof.create``,
+``BatchDLEQProof.invalid_or_unblind`` and pass verification depends on the
+host and on how long a caller can wait for one chunk.  ``calibrate`` times
+each operation at a range of chunk sizes and thread counts and picks, for
+each, the combination with the most throughput whose per-chunk latency is
+within a target.  ``load_or_calibrate`` keeps the result in a file so later
+processes on the same host can skip the measurements::
+
+    profile = load_or_calibrate("/var/cache/issuer/tuning.json", slo=0.005)
+    chunk_size = profile.operations["proof"].chunk_size
+"""
+
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from json import (
+    dumps,
+    loads,
+)
+from os import (
+    cpu_count,
+    replace,
+)
+from platform import (
+    machine,
+    python_implementation,
+    python_version,
+)
+from time import (
+    perf_counter,
+)
+
+import attr
+
+from . import (
+    Arena,
+    BatchDLEQProof,
+    PublicKey,
+    RandomToken,
+    VerificationKey,
+    random_signing_key,
+)
+
+PROFILE_VERSION = 1
+
+CHUNK_SIZES = (8, 16, 32, 64, 128, 256, 512)
+
+OPERATIONS = ("proof", "unblind", "verify")
+
+_MESSAGE = b"calibration"
+
+
+def host():
+    """
+    :return dict: A description of the current host.  A saved profile is
+        only reused on a host with the same description.
+    """
+    return {
+        "cpu_count": cpu_count(),
+        "machine": machine(),
+        "python_implementation": python_implementation(),
+        "python_version": python_version(),
+    }
+
+
+def _thread_counts():
+    counts = [1]
+    while counts[-1] * 2 <= (cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    return tuple(counts)
+
+
+@attr.s(frozen=True)
+class Measurement(object):
+    """
+    :ivar int chunk_size: The number of tokens in each chunk.
+    :ivar int threads: The number of chunks processed at once.
+    :ivar float latency: The slowest chunk, in seconds.
+    :ivar float throughput: Tokens processed per second across all threads.
+    """
+    chunk_size = attr.ib()
+    threads = attr.ib()
+    latency = attr.ib()
+    throughput = attr.ib()
+
+
+def choose(measurements, slo):
+    """
+    Pick the measurement with the highest throughput among those within the
+    latency target, or the one with the lowest latency if none is.
+
+    :param list[Measurement] measurements: The candidates.
+    :param float slo: The latency target in seconds.
+
+    :return Measurement: The choice.
+    """
+    within = list(m for m in measurements if m.latency <= slo)
+    if within:
+        return max(within, key=lambda m: (m.throughput, -m.chunk_size))
+    return min(measurements, key=lambda m: m.latency)
+
+
+@attr.s(frozen=True)
+class Profile(object):
+    """
+    The chosen chunk size and thread count of each operation on a host.
+
+    :ivar dict host: The ``host`` the profile was made on.
+    :ivar float slo: The latency target in seconds.
+    :ivar dict operations: A mapping from operation name to the chosen
+        ``Measurement``.
+    """
+    host = attr.ib()
+    slo = attr.ib()
+    operations = attr.ib()
+
+    def to_json(self):
+        return dumps({
+            "version": PROFILE_VERSION,
+            "host": self.host,
+            "slo": self.slo,
+            "operations": {
+                name: attr.asdict(measurement)
+                for (name, measurement)
+                in self.operations.items()
+            },
+        }, sort_keys=True, indent=2)
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        :raise ValueError: If ``text`` is not a profile of this version.
+        """
+        data = loads(text)
+        if data.get("version") != PROFILE_VERSION:
+            raise ValueError("unsupported profile version")
+        return cls(
+            host=data["host"],
+            slo=data["slo"],
+            operations={
+                name: Measurement(**measurement)
+                for (name, measurement)
+                in data["operations"].items()
+            },
+        )
+
+    def save(self, path):
+        """
+        Write the profile to ``path``, replacing any profile already there
+        only once the new one is completely written.
+        """
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(self.to_json())
+        replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(f.read())
+
+
+@attr.s
+class _Fixtures(object):
+    """
+    Everything needed to run each operation in chunks of each of
+    ``chunk_sizes`` tokens.
+    """
+    chunk_sizes = attr.ib()
+
+    def __attrs_post_init__(self):
+        self.signing_key = random_signing_key()
+        self.public_key = PublicKey.from_signing_key(self.signing_key)
+        self.tokens, self.blinded_tokens = RandomToken.create_and_blind_many(
+            max(self.chunk_sizes),
+        )
+        self.signed_tokens = list(map(self.signing_key.sign, self.blinded_tokens))
+        unblinded_tokens = RandomToken.unblind_many(self.tokens, self.signed_tokens)
+        self.token_preimages = list(t.preimage() for t in unblinded_tokens)
+        self.signatures = list(
+            t.derive_verification_key_sha512().sign_sha512(_MESSAGE)
+            for t
+            in unblinded_tokens
+        )
+        self.proofs = {
+            chunk_size: BatchDLEQProof.create(
+                self.signing_key,
+                self.blinded_tokens[:chunk_size],
+                self.signed_tokens[:chunk_size],
+            )
+            for chunk_size
+            in self.chunk_sizes
+        }
+
+    def run(self, operation, chunk_size):
+        with Arena():
+            if operation == "proof":
+                BatchDLEQProof.create(
+                    self.signing_key,
+                    self.blinded_tokens[:chunk_size],
+                    self.signed_tokens[:chunk_size],
+                )
+            elif operation == "unblind":
+                self.proofs[chunk_size].invalid_or_unblind(
+                    self.tokens[:chunk_size],
+                    self.blinded_tokens[:chunk_size],
+                    self.signed_tokens[:chunk_size],
+                    self.public_key,
+                )
+            elif operation == "verify":
+                rederive = self.signing_key.rederive_unblinded_token
+                VerificationKey.invalid_sha512_many(
+                    list(
+                        rederive(token_preimage).derive_verification_key_sha512()
+                        for token_preimage
+                        in self.token_preimages[:chunk_size]
+                    ),
+                    self.signatures[:chunk_size],
+                    _MESSAGE,
+                )
+            else:
+                raise ValueError("unknown operation {!r}".format(operation))
+
+
+def _timed(f, *a):
+    before = perf_counter()
+    f(*a)
+    return perf_counter() - before
+
+
+def measure(fixtures, operation, chunk_size, threads, executor, repeat):
+    """
+    Time ``threads`` chunks of ``operation`` run at once, ``repeat`` times,
+    keeping the fastest round.
+
+    :return Measurement: The result.
+    """
+    best = None
+    for _ in range(repeat):
+        before = perf_counter()
+        latencies = list(executor.map(
+            lambda _: _timed(fixtures.run, operation, chunk_size),
+            range(threads),
+        ))
+        elapsed = perf_counter() - before
+        measurement = Measurement(
+            chunk_size=chunk_size,
+            threads=threads,
+            latency=max(latencies),
+            throughput=chunk_size * threads / elapsed,
+        )
+        if best is None or measurement.throughput > best.throughput:
+            best = measurement
+    return best
+
+
+def calibrate(slo=0.01, operations=OPERATIONS, chunk_sizes=CHUNK_SIZES, thread_counts=None, repeat=3):
+    """
+    Measure the operations on this host and choose a chunk size and thread
+    count for each.
+
+    Chunk sizes are tried in increasing order and an operation stops
+    growing its chunks once a chunk on one thread misses the latency target
+    since larger chunks only take longer.
+
+    :param float slo: The latency target for one chunk, in seconds.
+    :param operations: The names of the operations to measure, from
+        ``OPERATIONS``.
+    :param chunk_sizes: The chunk sizes to try.
+    :param thread_counts: The thread counts to try or ``None`` for powers of
+        two up to the number of CPUs.
+    :param int repeat: The number of times to time each combination.
+
+    :return Profile: The choices.
+    """
+    if thread_counts is None:
+        thread_counts = _thread_counts()
+    chunk_sizes = sorted(chunk_sizes)
+    chosen = {}
+    with Arena(), ThreadPoolExecutor(max(thread_counts)) as executor:
+        fixtures = _Fixtures(chunk_sizes)
+        for operation in operations:
+            measurements = []
+            for chunk_size in chunk_sizes:
+                for threads in thread_counts:
+                    measurements.append(
+                        measure(fixtures, operation, chunk_size, threads, executor, repeat),
+                    )
+                if measurements[-len(thread_counts)].latency > slo:
+                    break
+            chosen[operation] = choose(measurements, slo)
+    return Profile(host=host(), slo=slo, operations=chosen)
+
+
+def load_or_calibrate(path, slo=0.01, **kwargs):
+    """
+    Load the profile saved at ``path`` if it was made on this host for the
+    same latency target and has every operation asked for.  Otherwise
+    calibrate and save the new profile there.
+
+    :param kwargs: Passed on to ``calibrate``.
+
+    :return Profile: The profile.
+    """
+    try:
+        profile = Profile.load(path)
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        profile = None
+    operations = kwargs.get("operations", OPERATIONS)
+    if (
+        profile is None
+        or profile.host != host()
+        or profile.slo != slo
+        or not set(operations) <= set(profile.operations)
+    ):
+        profile = calibrate(slo=slo, **kwargs)
+        profile.save(path)
+    return profile
@@ -0,0 +1,284 @@
+"""
+Verification of redemption passes from many concurrent requests in batches.
+
+A redemption service typically gets a great many small requests.  Instead of
+verifying each one as it arrives, ``BatchingVerifier`` collects passes from
+all of its callers for a short time and verifies them together on one worker
+thread.
+"""
+
+from collections import (
+    deque,
+)
+from concurrent.futures import (
+    Future,
+)
+from threading import (
+    Condition,
+    Thread,
+)
+from time import (
+    monotonic,
+)
+
+import attr
+
+from . import (
+    Arena,
+    VerificationKey,
+)
+from .stats import (
+    Histogram,
+    exponential_bounds,
+)
+
+
+def _latency_histogram():
+    # 50 microseconds up to about 1.6 seconds.
+    return Histogram(exponential_bounds(0.00005, 2, 16))
+
+
+@attr.s
+class _Request(object):
+    message = attr.ib()
+    passes = attr.ib()
+    future = attr.ib()
+    submitted = attr.ib()
+
+
+def _fill_histogram(flush_size):
+    # Powers of two up to the flush size.
+    bounds = [1]
+    while bounds[-1] < flush_size:
+        bounds.append(min(bounds[-1] * 2, flush_size))
+    return Histogram(bounds)
+
+
+def _verify_passes(signing_key, messages_and_passes):
+    """
+    Verify passes, each with its own message, checking all of the passes for
+    each distinct message together.
+
+    :return: A ``list`` of ``bool``, ``True`` for each invalid pass.
+    """
+    rederive = signing_key.rederive_unblinded_token
+    by_message = {}
+    count = 0
+    for (message, (token_preimage, signature)) in messages_and_passes:
+        keys, signatures, indexes = by_message.setdefault(message, ([], [], []))
+        keys.append(rederive(token_preimage).derive_verification_key_sha512())
+        signatures.append(signature)
+        indexes.append(count)
+        count += 1
+
+    invalid = [None] * count
+    for (message, (keys, signatures, indexes)) in by_message.items():
+        bitmap = VerificationKey.invalid_sha512_many(keys, signatures, message)
+        for (bit, index) in enumerate(indexes):
+            invalid[index] = bool(bitmap >> bit & 1)
+    return invalid
+
+
+def _verify_batch(signing_key, batch):
+    """
+    Verify all of the passes of a batch of requests together.  The
+    unblinded tokens and verification keys made along the way are destroyed
+    before returning.
+
+    :return: A ``list`` with one ``list`` of ``bool`` for each request in the
+        batch.
+    """
+    with Arena():
+        invalid = _verify_passes(
+            signing_key,
+            (
+                (request.message, a_pass)
+                for request in batch
+                for a_pass in request.passes
+            ),
+        )
+    results = []
+    offset = 0
+    for request in batch:
+        results.append(invalid[offset:offset + len(request.passes)])
+        offset += len(request.passes)
+    return results
+
+
+@attr.s
+class BatchingVerifier(object):
+    """
+    Verify passes submitted by concurrent callers in batches.
+
+    A batch is verified once it holds at least ``flush_size`` passes or once
+    the oldest request in it has waited ``deadline`` seconds, whichever comes
+    first.
+
+    :ivar SigningKey signing_key: The key which signed the tokens the passes
+        were made from.
+    :ivar int flush_size: The number of passes at which to verify a batch
+        without waiting for the deadline.
+    :ivar float deadline: The longest time, in seconds, a request waits for
+        other requests to join its batch.
+    :ivar Histogram latency: The time, in seconds, from the submission of
+        each request to its result being available.
+    :ivar Histogram batch_fill: The number of passes in each verified batch.
+    """
+    signing_key = attr.ib()
+    flush_size = attr.ib(default=256)
+    deadline = attr.ib(default=0.002)
+
+    latency = attr.ib(init=False, default=attr.Factory(_latency_histogram))
+    batch_fill = attr.ib(init=False)
+
+    _requests = attr.ib(init=False, default=attr.Factory(deque))
+    _pending = attr.ib(init=False, default=0)
+    _condition = attr.ib(init=False, default=attr.Factory(Condition))
+    _stopping = attr.ib(init=False, default=False)
+    _thread = attr.ib(init=False, default=None)
+
+    @batch_fill.default
+    def _batch_fill_default(self):
+        return _fill_histogram(self.flush_size)
+
+    def __attrs_post_init__(self):
+        if self.flush_size < 1:
+            raise ValueError("BatchingVerifier requires a positive flush_size")
+        if self.deadline < 0:
+            raise ValueError("BatchingVerifier requires a non-negative deadline")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Start verifying batches on a background thread.
+        """
+        with self._condition:
+            if self._thread is not None:
+                raise ValueError("BatchingVerifier is already started")
+            self._stopping = False
+            self._thread = Thread(
+                target=self._run,
+                name="BatchingVerifier",
+            )
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Verify any requests already submitted and then stop the background
+        thread.
+        """
+        with self._condition:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+        thread.join()
+        with self._condition:
+            self._thread = None
+
+    def submit(self, message, passes):
+        """
+        Submit one request's passes for verification.
+
+        :param bytes message: The message the passes are expected to have
+            signed.
+        :param list passes: Two-tuples of ``TokenPreimage`` and
+            ``VerificationSignature``.
+
+        :return Future: A future which is resolved with a ``list`` of
+            ``bool``, one per pass in order, ``True`` if the pass is invalid
+            and ``False`` otherwise.  If verification fails with an exception
+            then the future fails with it instead.
+        """
+        future = Future()
+        request = _Request(message, list(passes), future, monotonic())
+        with self._condition:
+            if self._thread is None or self._stopping:
+                raise ValueError("BatchingVerifier is not running")
+            self._requests.append(request)
+            self._pending += len(request.passes)
+            self._condition.notify_all()
+        return future
+
+    def verify(self, message, passes, timeout=None):
+        """
+        Submit a request and wait for its result.
+
+        :see: ``submit``
+        """
+        return self.submit(message, passes).result(timeout)
+
+    def verify_async(self, message, passes):
+        """
+        Submit a request from an ``asyncio`` event loop.
+
+        :see: ``submit``
+
+        :return: An ``asyncio.Future`` for the result.
+        """
+        from asyncio import wrap_future
+        return wrap_future(self.submit(message, passes))
+
+    def _take_batch(self):
+        """
+        Wait for a batch to be ready and take it from the queue.
+
+        :return: A ``list`` of ``_Request`` or ``None`` if the verifier is
+            stopping and there is nothing left to verify.
+        """
+        with self._condition:
+            while not self._requests:
+                if self._stopping:
+                    return None
+                self._condition.wait()
+            flush_at = self._requests[0].submitted + self.deadline
+            while self._pending < self.flush_size and not self._stopping:
+                remaining = flush_at - monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            size = 0
+            while self._requests and (
+                not batch or
+                size + len(self._requests[0].passes) <= self.flush_size
+            ):
+                request = self._requests.popleft()
+                batch.append(request)
+                size += len(request.passes)
+            self._pending -= size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self.batch_fill.record(sum(len(request.passes) for request in batch))
+            try:
+                results = _verify_batch(self.signing_key, batch)
+            except Exception:
+                results = None
+            for (index, request) in enumerate(batch):
+                self._deliver(request, None if results is None else results[index])
+
+    def _deliver(self, request, result):
+        if result is None:
+            # Something in the batch was bad.  Verify this request on its own
+            # so that only the requests at fault see the failure.
+            try:
+                [result] = _verify_batch(self.signing_key, [request])
+            except Exception as e:
+                request.future.set_exception(e)
+        if result is not None:
+            request.future.set_result(result)
+        self.latency.record(monotonic() - request.submitted)
@@ -0,0 +1,275 @@
+"""
+A compact, versioned binary container for batches of tokens.
+
+Every container starts with a header::
+
+    magic   4 bytes   b"CBRW"
+    version 1 byte    currently 1
+    kind    1 byte    ISSUE_REQUEST, ISSUE_RESPONSE, or REDEMPTION
+    count   4 bytes   big-endian number of records
+
+followed by ``count`` records and then, for some kinds, a trailer.  Records
+and trailers are a fixed (per kind) number of fields and each field is a
+two-byte big-endian length followed by that many bytes of the object's
+encoding (the base64-decoded form of ``encode_base64``).
+
+The fields of each kind are:
+
+  * ``ISSUE_REQUEST``: each record is a ``BlindedToken``.  No trailer.
+  * ``ISSUE_RESPONSE``: each record is a ``SignedToken``.  The trailer is the
+    ``BatchDLEQProof`` for all of them.
+  * ``REDEMPTION``: each record is a ``TokenPreimage`` and a
+    ``VerificationSignature``.  No trailer.
+"""
+
+from base64 import (
+    b64decode,
+    b64encode,
+)
+from struct import (
+    Struct,
+)
+
+import attr
+
+from . import (
+    DecodeException,
+    BlindedToken,
+    SignedToken,
+    BatchDLEQProof,
+    TokenPreimage,
+    VerificationSignature,
+)
+
+MAGIC = b"CBRW"
+VERSION = 1
+
+ISSUE_REQUEST = 1
+ISSUE_RESPONSE = 2
+REDEMPTION = 3
+
+_HEADER = Struct(">4sBBI")
+_LENGTH = Struct(">H")
+
+# The types of the fields of the records and of the trailer of each kind.
+_LAYOUTS = {
+    ISSUE_REQUEST: ((BlindedToken,), ()),
+    ISSUE_RESPONSE: ((SignedToken,), (BatchDLEQProof,)),
+    REDEMPTION: ((TokenPreimage, VerificationSignature), ()),
+}
+
+
+class WireFormatException(DecodeException):
+    """
+    A container is malformed, truncated, or of an unsupported version or
+    kind.
+    """
+
+
+def _read_exactly(stream, length):
+    data = stream.read(length)
+    if len(data) != length:
+        raise WireFormatException(
+            "expected {} bytes, got {}".format(length, len(data)),
+        )
+    return data
+
+
+def _layout(kind):
+    try:
+        return _LAYOUTS[kind]
+    except KeyError:
+        raise WireFormatException("unknown container kind {}".format(kind))
+
+
+@attr.s
+class Writer(object):
+    """
+    Write a container to a stream one record at a time.
+
+    :ivar stream: A binary file-like object to write to.
+    :ivar int kind: The kind of container to write.
+    :ivar int count: The number of records which will be written.
+    """
+    stream = attr.ib()
+    kind = attr.ib()
+    count = attr.ib()
+
+    _written = attr.ib(init=False, default=0)
+
+    def __attrs_post_init__(self):
+        self._record_types, self._trailer_types = _layout(self.kind)
+        self.stream.write(_HEADER.pack(MAGIC, VERSION, self.kind, self.count))
+
+    def _write_fields(self, types, fields):
+        if len(fields) != len(types):
+            raise ValueError(
+                "expected {} fields, got {}".format(len(types), len(fields)),
+            )
+        write = self.stream.write
+        for (cls, field) in zip(types, fields):
+            if not isinstance(field, cls):
+                raise TypeError(
+                    "expected {}, got {!r}".format(cls.__name__, field),
+                )
+            raw = b64decode(field.encode_base64())
+            write(_LENGTH.pack(len(raw)))
+            write(raw)
+
+    def write(self, *fields):
+        """
+        Write one record.
+        """
+        if self._written == self.count:
+            raise ValueError("all {} records already written".format(self.count))
+        self._write_fields(self._record_types, fields)
+        self._written += 1
+
+    def finish(self, *trailer):
+        """
+        Write the trailer, if this kind has one, and check that the promised
+        number of records was written.
+        """
+        if self._written != self.count:
+            raise ValueError(
+                "wrote {} records but promised {}".format(self._written, self.count),
+            )
+        self._write_fields(self._trailer_types, trailer)
+
+
+@attr.s
+class Reader(object):
+    """
+    Read a container from a stream one record at a time.
+
+    :ivar stream: A binary file-like object to read from.
+    :ivar int kind: The kind of the container, read from its header.
+    :ivar int count: The number of records in the container, read from its
+        header.
+    """
+    stream = attr.ib()
+    kind = attr.ib(init=False)
+    count = attr.ib(init=False)
+
+    def __attrs_post_init__(self):
+        magic, version, self.kind, self.count = _HEADER.unpack(
+            _read_exactly(self.stream, _HEADER.size),
+        )
+        if magic != MAGIC:
+            raise WireFormatException("not a token container")
+        if version != VERSION:
+            raise WireFormatException("unsupported version {}".format(version))
+        self._record_types, self._trailer_types = _layout(self.kind)
+
+    def _read_fields(self, types):
+        read = self.stream.read
+        fields = []
+        for cls in types:
+            (length,) = _LENGTH.unpack(_read_exactly(self.stream, _LENGTH.size))
+            raw = read(length)
+            if len(raw) != length:
+                raise WireFormatException("truncated field")
+            fields.append(cls.decode_base64(b64encode(raw)))
+        return tuple(fields)
+
+    def records(self):
+        """
+        Read and decode the records.
+
+        :return: An iterator of tuples of the decoded fields of each record.
+        """
+        for _ in range(self.count):
+            yield self._read_fields(self._record_types)
+
+    def trailer(self):
+        """
+        Read and decode the trailer.  This must be called only after all of
+        the records have been read.
+
+        :return: A tuple of the decoded fields of the trailer.
+        """
+        return self._read_fields(self._trailer_types)
+
+
+def read_raw_containers(stream):
+    """
+    Split a stream of concatenated containers without decoding any of the
+    objects in them.
+
+    :return: An iterator of ``bytes``, one complete container each.
+    """
+    while True:
+        header = stream.read(_HEADER.size)
+        if not header:
+            return
+        if len(header) != _HEADER.size:
+            raise WireFormatException("truncated header")
+        magic, version, kind, count = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise WireFormatException("not a token container")
+        if version != VERSION:
+            raise WireFormatException("unsupported version {}".format(version))
+        record_types, trailer_types = _layout(kind)
+        parts = [header]
+        for _ in range(count * len(record_types) + len(trailer_types)):
+            length = _read_exactly(stream, _LENGTH.size)
+            parts.append(length)
+            parts.append(_read_exactly(stream, _LENGTH.unpack(length)[0]))
+        yield b"".join(parts)
+
+
+def _expect(reader, kind):
+    if reader.kind != kind:
+        raise WireFormatException(
+            "expected container kind {}, got {}".format(kind, reader.kind),
+        )
+    return reader
+
+
+def write_issue_request(stream, blinded_tokens):
+    writer = Writer(stream, ISSUE_REQUEST, len(blinded_tokens))
+    for blinded_token in blinded_tokens:
+        writer.write(blinded_token)
+    writer.finish()
+
+
+def read_issue_request(stream):
+    """
+    :return: A ``list`` of ``BlindedToken``.
+    """
+    reader = _expect(Reader(stream), ISSUE_REQUEST)
+    return list(blinded_token for (blinded_token,) in reader.records())
+
+
+def write_issue_response(stream, signed_tokens, proof):
+    writer = Writer(stream, ISSUE_RESPONSE, len(signed_tokens))
+    for signed_token in signed_tokens:
+        writer.write(signed_token)
+    writer.finish(proof)
+
+
+def read_issue_response(stream):
+    """
+    :return: A two-tuple of a ``list`` of ``SignedToken`` and the
+        ``BatchDLEQProof`` for them.
+    """
+    reader = _expect(Reader(stream), ISSUE_RESPONSE)
+    signed_tokens = list(signed_token for (signed_token,) in reader.records())
+    (proof,) = reader.trailer()
+    return signed_tokens, proof
+
+
+def write_redemption(stream, passes):
+    writer = Writer(stream, REDEMPTION, len(passes))
+    for (token_preimage, signature) in passes:
+        writer.write(token_preimage, signature)
+    writer.finish()
+
+
+def read_redemption(stream):
+    """
+    :return: A ``list`` of two-tuples of ``TokenPreimage`` and
+        ``VerificationSignature``.
+    """
+    reader = _expect(Reader(stream), REDEMPTION)
+    return list(reader.records())
@@ -36,13 +36,9 @@ class Client(object):
 
     def request(self, count):
         debug("generating tokens")
-        clients_tokens = list(RandomToken.create() for _ in range(count))
+        clients_tokens = RandomToken.create_many(count)
         debug("blinding tokens")
-        clients_blinded_tokens = list(
-            token.blind()
-            for token
-            in clients_tokens
-        )
+        clients_blinded_tokens = RandomToken.blind_many(clients_tokens)
         debug("marshaling blinded tokens")
         marshaled_blinded_tokens = list(
             blinded_token.encode_base64()